@@ -0,0 +1,94 @@
+import math
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from cache import LRUCache
+from table_router import normalize_query
+
+# Words that point back into the conversation; the answer to such a question depends on
+# what was said before it, not only on the question and the data
+_ANAPHORA = re.compile(
+    r"\b(it|its|they|them|their|theirs|those|these|same|above|previous|earlier|again|what about|how about|the rest)\b"
+)
+
+
+def _unit(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+# Finished agent answers keyed on (data version, language, normalized question). The version
+# in the key means an answer is only ever served for the data it was computed from, and the
+# owner clears the cache on every swap so old versions do not sit in memory until evicted.
+# With an embedding function and a threshold, a question that is worded differently but
+# close enough to a cached one (cosine similarity) is answered from it as well.
+class AnswerCache:
+    def __init__(self,
+                 max_entries: int = 1024,
+                 ttl: Optional[float] = 3600,
+                 similarity_threshold: float = 0.0):
+        self.cache = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.similarity_threshold = similarity_threshold
+        self._vectors = OrderedDict()    # key -> unit vector, for entries stored with one
+        self._lock = threading.Lock()
+        self.similar_hits = 0
+        self.skipped = 0
+
+    @property
+    def semantic(self) -> bool:
+        return 0 < self.similarity_threshold <= 1
+
+    def cacheable(self, query: str) -> bool:
+        normalized = normalize_query(query)
+        if not normalized or _ANAPHORA.search(normalized):
+            with self._lock:
+                self.skipped += 1
+            return False
+        return True
+
+    def get(self, version: int, language: str, query: str) -> Optional[dict]:
+        return self.cache.get((version, language, normalize_query(query)))
+
+    def similar(self, version: int, language: str, vector: List[float]) -> Optional[Tuple[dict, float]]:
+        vector = _unit(vector)
+        with self._lock:
+            candidates = [(key, v) for key, v in self._vectors.items() if key[0] == version and key[1] == language]
+        best, best_score = None, self.similarity_threshold
+        for key, stored in candidates:
+            score = sum(a * b for a, b in zip(vector, stored))
+            if score >= best_score:
+                best, best_score = key, score
+        if best is None:
+            return None
+        entry = self.cache.get(best)
+        if entry is None:
+            # Expired or evicted since; its vector goes with it
+            with self._lock:
+                self._vectors.pop(best, None)
+            return None
+        with self._lock:
+            self.similar_hits += 1
+        return entry, best_score
+
+    def put(self, version: int, language: str, query: str, entry: dict, vector: Optional[List[float]] = None):
+        key = (version, language, normalize_query(query))
+        self.cache.put(key, entry)
+        if vector is not None:
+            with self._lock:
+                self._vectors[key] = _unit(vector)
+                self._vectors.move_to_end(key)
+                while len(self._vectors) > self.cache.max_entries:
+                    self._vectors.popitem(last=False)
+
+    def clear(self):
+        self.cache.clear()
+        with self._lock:
+            self._vectors.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            vectors, similar_hits, skipped = len(self._vectors), self.similar_hits, self.skipped
+        return {**self.cache.stats(), "similar_hits": similar_hits, "skipped": skipped,
+                "vectors": vectors, "similarity_threshold": self.similarity_threshold if self.semantic else None}
@@ -1,11 +1,24 @@
 import os
+import time
+import asyncio
+import functools
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from langchain_openai import AzureChatOpenAI
 from langchain.agents import AgentExecutor, create_tool_calling_agent
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from langchain_core.output_parsers import CommaSeparatedListOutputParser
 from api_class import APILookup, APITableConfig
-from sql_memdb import GlobalDataManager
+from sql_memdb import GlobalDataManager, acquire_process_lock
+from sql_guard import QueryGuard
+from table_router import TableRouter
+from session_summary import SessionSummaryStore
+from answer_cache import AnswerCache
+from memory_queue import MemoryWriteQueue
+from cache import LRUCache
+from telemetry import tracer, SpanCallbackHandler, JsonLinesHook, load_hook
 from mem0 import Memory
 import json
 
@@ -13,7 +26,8 @@ os.environ["AZURE_OPENAI_API_KEY"] = os.environ.get("AZURE_OPENAI_API_KEY", "Azu
 os.environ["AZURE_OPENAI_ENDPOINT"] = os.environ.get("AZURE_OPENAI_ENDPOINT", "https://openai-ragbot.openai.azure.com/")
 
 
-CONFIG_FILE = "/app/data/config.json"
+DATA_DIR = os.environ.get("APP_DATA_DIR", "/app/data")
+CONFIG_FILE = os.path.join(DATA_DIR, "config.json")
 
 if os.path.exists("config.json") and not os.path.exists(CONFIG_FILE):
     import shutil
@@ -40,7 +54,11 @@ def load_api_configs():
             pk=item["pk"],
             name_field=item.get("name_field"),
             description=item["description"],
-            relationships=item.get("relationships", [])
+            relationships=item.get("relationships", []),
+            modified_field=item.get("modified_field"),
+            indexes=item.get("indexes"),
+            search_fields=item.get("search_fields"),
+            column_types=item.get("column_types")
         )
         configs.append(table_config)
 
@@ -48,13 +66,20 @@ def load_api_configs():
             config=table_config,
             url=item["api_url"],
             json_key=item.get("json_key", "data"),
-            payload=item.get("payload", {})
+            payload=item.get("payload", {}),
+            timeout=item.get("timeout", 10),
+            pagination=item.get("pagination"),
+            modified_since_param=item.get("modified_since_param")
         )
         apis.append(api_lookup)
     
     return configs, apis
 
+def _config_mtime():
+    return os.path.getmtime(CONFIG_FILE) if os.path.exists(CONFIG_FILE) else None
+
 all_configs, all_apis = load_api_configs()
+config_mtime = _config_mtime()
 
 
 llm = AzureChatOpenAI(
@@ -64,7 +89,79 @@ llm = AzureChatOpenAI(
     verbose=True
 )
 
-db_manager = GlobalDataManager(all_apis)
+INGEST_MAX_WORKERS = int(os.environ.get("INGEST_MAX_WORKERS", "8"))
+
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR", os.path.join(DATA_DIR, "snapshot"))
+# Set when running several uvicorn workers: one of them loads, all of them read the published file
+SHARED_DB = os.environ.get("SHARED_DB", "0").lower() in ("1", "true", "yes")
+
+db_manager = GlobalDataManager(
+    all_apis,
+    max_workers=INGEST_MAX_WORKERS,
+    snapshot_dir=SNAPSHOT_DIR or None,
+    shared=SHARED_DB,
+    apis_loader=lambda: load_api_configs()[1],
+    query_guard=QueryGuard(
+        timeout=float(os.environ.get("SQL_TIMEOUT_SECONDS", "5")),
+        max_cross_rows=int(os.environ.get("SQL_MAX_CROSS_ROWS", "10000000"))
+    )
+)
+db_manager.warm_start()
+
+def sync_agent_config(version=None):
+    # Another worker may have saved config.json; pick it up before rebuilding anything on it
+    global all_configs, all_apis, config_mtime
+    if _config_mtime() == config_mtime:
+        return
+    all_configs, all_apis = load_api_configs()
+    config_mtime = _config_mtime()
+    db_manager.apis = all_apis
+    agent_registry.rebuild(all_apis, llm)
+    print(f"API configurations synced from {CONFIG_FILE}.")
+
+if SHARED_DB:
+    db_manager.add_swap_listener(sync_agent_config)
+
+# Known entity names are held as Python strings in every worker; the cap keeps that bounded
+# on large tables, where names past it simply fall back to the LLM router.
+table_router = TableRouter(max_names_per_table=int(os.environ.get("ROUTER_MAX_NAMES", "20000")))
+
+def rebuild_table_router(version=None):
+    names = {}
+    for api in all_apis:
+        if api.config.name_field:
+            names[api.safe_name] = db_manager.distinct_values(
+                api.safe_name, api.config.name_field, limit=table_router.max_names_per_table)
+    table_router.build(all_configs, columns=db_manager.table_columns(), names=names)
+    print(f"Table router rebuilt for data version {db_manager.version}.")
+
+db_manager.add_swap_listener(rebuild_table_router)
+rebuild_table_router()
+
+# Chroma's local PersistentClient must not be opened by more than one process. Several uvicorn
+# workers share memories through a Chroma server (MEM0_CHROMA_HOST); without one, the first
+# process to start holds the local store and any other refuses to start rather than corrupt it.
+MEM0_CHROMA_HOST = os.environ.get("MEM0_CHROMA_HOST")
+MEM0_CHROMA_PATH = os.path.join(DATA_DIR, "mem0_chroma")
+_memory_store_lock = None
+
+def claim_local_memory_store(path):
+    global _memory_store_lock
+    try:
+        _memory_store_lock = acquire_process_lock(path, "process.lock")
+    except ImportError:
+        return                  # no flock on this platform; single-process use is assumed
+    if _memory_store_lock is None:
+        raise RuntimeError(
+            f"The local memory store {path} is already open in another process. Run a single worker "
+            f"(UVICORN_WORKERS=1) or point MEM0_CHROMA_HOST at a Chroma server to run several."
+        )
+
+if MEM0_CHROMA_HOST:
+    chroma_config = {"host": MEM0_CHROMA_HOST, "port": int(os.environ.get("MEM0_CHROMA_PORT", "8000"))}
+else:
+    claim_local_memory_store(MEM0_CHROMA_PATH)
+    chroma_config = {"path": MEM0_CHROMA_PATH}
 
 mem0_config = {
     "llm": {
@@ -95,28 +192,89 @@ mem0_config = {
         "provider": "chroma",
         "config": {
             "collection_name": "api_agent_memories",
-            "path": "/app/data/mem0_chroma",
+            **chroma_config,
         }
     }
 }
 
 memory = Memory.from_config(mem0_config)
 
-def get_session_context(session_id, window_size=5):
+memory_writes = MemoryWriteQueue(
+    memory,
+    batch_size=int(os.environ.get("MEMORY_WRITE_BATCH", "32")),
+    flush_interval=float(os.environ.get("MEMORY_WRITE_INTERVAL", "0.5"))
+)
+
+session_summaries = SessionSummaryStore(
+    os.path.join(DATA_DIR, "session_summaries.db"),
+    max_sessions=int(os.environ.get("SUMMARY_CACHE_SESSIONS", "1024")),
+    idle_ttl=float(os.environ.get("SUMMARY_IDLE_SECONDS", "3600"))
+)
+
+# Finished answers to standalone data questions, reused until the data changes
+ANSWER_CACHE = os.environ.get("ANSWER_CACHE", "1").lower() not in ("0", "false", "no")
+ANSWER_CACHE_EMBED_TIMEOUT = float(os.environ.get("ANSWER_CACHE_EMBED_TIMEOUT", "2"))
+answer_cache = AnswerCache(
+    max_entries=int(os.environ.get("ANSWER_CACHE_ENTRIES", "1024")),
+    ttl=float(os.environ.get("ANSWER_CACHE_TTL", "3600")),
+    similarity_threshold=float(os.environ.get("ANSWER_CACHE_SIMILARITY", "0"))
+)
+
+def clear_answer_cache(version=None):
+    answer_cache.clear()
+
+db_manager.add_swap_listener(clear_answer_cache)
+
+# mem0 and the describe/SQL helpers are synchronous; they run here instead of on the event loop
+BLOCKING_POOL = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("AGENT_BLOCKING_WORKERS", "16")),
+    thread_name_prefix="agent-blocking"
+)
+
+# Spans go to the /metrics histograms; these ship them elsewhere as well
+TRACE_LOG_FILE = os.environ.get("TRACE_LOG_FILE")
+if TRACE_LOG_FILE:
+    tracer.add_hook(JsonLinesHook(TRACE_LOG_FILE))
+for hook_spec in filter(None, (spec.strip() for spec in os.environ.get("TRACE_HOOKS", "").split(","))):
     try:
-        results = memory.get_all(user_id=session_id)
-        
-        if isinstance(results, dict):
-            raw_list = results.get("results", [])
+        tracer.add_hook(load_hook(hook_spec))
+    except Exception as e:
+        print(f"Could not load trace hook {hook_spec}: {e}")
+
+# Per-stage budgets for the work done before the agent starts
+MEMORY_SEARCH_TIMEOUT = float(os.environ.get("MEMORY_SEARCH_TIMEOUT", "3"))
+SESSION_CONTEXT_TIMEOUT = float(os.environ.get("SESSION_CONTEXT_TIMEOUT", "8"))
+ROUTING_TIMEOUT = float(os.environ.get("ROUTING_TIMEOUT", "8"))
+
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(BLOCKING_POOL, functools.partial(func, *args, **kwargs))
+
+def session_memories(session_id):
+    # Stored memories plus writes still queued for this session. Pending texts are read first
+    # so a write that lands while get_all runs shows up in one of the two lists.
+    pending = memory_writes.pending(session_id)
+    results = memory.get_all(user_id=session_id)
+
+    if isinstance(results, dict):
+        raw_list = results.get("results", [])
+    else:
+        raw_list = results
+
+    all_texts = []
+    for item in raw_list:
+        if isinstance(item, dict):
+            all_texts.append(item.get('memory', ''))
         else:
-            raw_list = results
-            
-        all_texts = []
-        for item in raw_list:
-            if isinstance(item, dict):
-                all_texts.append(item.get('memory', ''))
-            else:
-                all_texts.append(str(item))
+            all_texts.append(str(item))
+
+    stored = set(all_texts)
+    all_texts.extend(text for text in pending if text not in stored)
+    return all_texts
+
+async def aget_session_context(session_id, window_size=5):
+    try:
+        all_texts = await run_blocking(session_memories, session_id)
 
         if not all_texts:
             return "", []
@@ -130,15 +288,7 @@ def get_session_context(session_id, window_size=5):
 
         conversation_summary = "No previous context."
         if older_texts:
-            print(f"Summarizing {len(older_texts)} older messages:")
-            text_block = "\n".join(older_texts)
-            summary_prompt = (
-                f"Summarize the following previous conversation history concisely. "
-                f"Focus on the entities discussed, specific constraints applied, and the user's goal.\n\n"
-                f"HISTORY:\n{text_block}"
-            )
-            summary_res = llm.invoke(summary_prompt)
-            conversation_summary = summary_res.content
+            conversation_summary = await _rolling_summary(session_id, older_texts)
 
         recent_objs = []
         for text in recent_texts:
@@ -159,14 +309,42 @@ def get_session_context(session_id, window_size=5):
         print(f"Context Manager Error: {e}")
         return "Error loading context.", []
 
-def select_relevant_tables(user_query, configs):
+async def _rolling_summary(session_id, older_texts):
+    # Only messages that left the recent window since the last turn are sent to the LLM
+    # The summary store is SQLite; its reads and commits stay off the event loop
+    previous, new_texts = await run_blocking(session_summaries.pending, session_id, older_texts)
+    if previous is not None and not new_texts:
+        return previous
+
+    text_block = "\n".join(new_texts)
+    if previous is None:
+        print(f"Summarizing {len(new_texts)} older messages:")
+        summary_prompt = (
+            f"Summarize the following previous conversation history concisely. "
+            f"Focus on the entities discussed, specific constraints applied, and the user's goal.\n\n"
+            f"HISTORY:\n{text_block}"
+        )
+    else:
+        print(f"Folding {len(new_texts)} messages into the session summary:")
+        summary_prompt = (
+            f"Summarize the conversation so far by updating the summary below with the new messages. Keep it concise. "
+            f"Focus on the entities discussed, specific constraints applied, and the user's goal.\n\n"
+            f"SUMMARY SO FAR:\n{previous}\n\nNEW MESSAGES:\n{text_block}"
+        )
+    with tracer.span("summarize", messages=len(new_texts), incremental=previous is not None):
+        summary_res = await llm.ainvoke(summary_prompt, config={"callbacks": [SpanCallbackHandler(tracer, "summary")]})
+    await run_blocking(session_summaries.put, session_id, summary_res.content, older_texts)
+    return summary_res.content
+
+async def aselect_relevant_tables(user_query, configs):
     table_menu = "\n".join([f"- {c.name}: {c.description}" for c in configs])
     router_prompt = ChatPromptTemplate.from_messages([
         ("system", "You are a Database Router. Select relevant tables from the list. Return ONLY comma-separated names. IF NO TABLE IS RELEVANT (e.g., query is about general knowledge, manuals, technical specs not in DB), RETURN 'None'. If the query is a simple greeting or a conversational follow-up about the chat history (e.g., 'hi', 'what did I ask', 'repeat that'), RETURN 'General'."),
         ("human", "Available Tables:\n{menu}\n\nQuery: {query}")
     ])
     chain = router_prompt | llm | CommaSeparatedListOutputParser() # LCEL (LangChain Expression Language)
-    return chain.invoke({"menu": table_menu, "query": user_query})
+    return await chain.ainvoke({"menu": table_menu, "query": user_query},
+                               config={"callbacks": [SpanCallbackHandler(tracer, "router")]})
 
 def convert_history_to_messages(history_list):
     messages = []
@@ -180,46 +358,115 @@ def convert_history_to_messages(history_list):
     return messages
 
 def run_agent(user_query, session_id="default", history=[], language="Default English"):
-    print(f" User Query: {user_query} (Session: {session_id}, Language: {language})")
-    
+    return asyncio.run(arun_agent(user_query, session_id=session_id, history=history, language=language))
+
+class EarlyResponse(Exception):
+    def __init__(self, response):
+        super().__init__(response)
+        self.response = response
+
+async def aroute_tables(user_query):
+    # Past decisions first, then the local scorer; only ambiguous queries pay for an LLM call
+    relevant_names = table_router.cached(user_query)
+    if relevant_names is not None:
+        return relevant_names, "cache"
+
+    relevant_names = table_router.route(user_query)
+    source = "local"
+    if relevant_names is None:
+        relevant_names = await aselect_relevant_tables(user_query, all_configs)
+        source = "llm"
+    table_router.remember(user_query, relevant_names, source)
+    return relevant_names, source
+
+async def _route(user_query):
     try:
-        memories = memory.search(user_query, user_id=session_id)
-        semantic_facts = "\n".join([m['memory'] for m in memories]) if memories else "No relevant facts found."
-    except:
-        semantic_facts = "Memory Unavailable"
+        relevant_names, source = await asyncio.wait_for(aroute_tables(user_query), ROUTING_TIMEOUT)
+        print(f" Selected Tables ({source}): {relevant_names}")
+    except asyncio.TimeoutError:
+        # Let the agent see every table rather than fail the request on a slow router
+        relevant_names = [c.name for c in all_configs]
+        print(f"Routing timed out after {ROUTING_TIMEOUT}s, using all tables: {relevant_names}")
+        return relevant_names
+    except Exception as e:
+        print(f"Routing Error: {e}")
+        raise EarlyResponse("Error in routing.")
+
+    if not relevant_names or (len(relevant_names) == 1 and "none" in relevant_names[0].lower()):
+        print(" No relevant tables found (Query is likely for RAG/General).")
+        raise EarlyResponse("No relevant data found in the database. This query might be better suited for the Manuals/RAG.")
+
+    if len(relevant_names) == 1 and "general" in relevant_names[0].lower():
+        print(" Detected General Query. Proceeding without specific tables.")
+        relevant_names = []
+    return relevant_names
+
+async def _semantic_facts(user_query, session_id):
+    try:
+        memories = await asyncio.wait_for(run_blocking(memory.search, user_query, user_id=session_id), MEMORY_SEARCH_TIMEOUT)
+    except asyncio.TimeoutError:
+        print(f"Memory search timed out after {MEMORY_SEARCH_TIMEOUT}s")
+        return "Memory Unavailable"
+    except Exception as e:
+        print(f"Memory Search Error: {e}")
+        return "Memory Unavailable"
+
+    if isinstance(memories, dict):
+        memories = memories.get("results", [])
+    facts = [m.get("memory", "") if isinstance(m, dict) else str(m) for m in memories or []]
+    return "\n".join(facts) if facts else "No relevant facts found."
 
+async def _session_history(session_id, history):
     if history:
         print(f"Using provided history ({len(history)} messages)")
-        recent_chat_history = convert_history_to_messages(history)
-        past_summary = "Refer to the chat history for context."
-    else:
-        past_summary, recent_chat_history = get_session_context(session_id, window_size=5)
+        return "Refer to the chat history for context.", convert_history_to_messages(history)
+    try:
+        return await asyncio.wait_for(aget_session_context(session_id, window_size=5), SESSION_CONTEXT_TIMEOUT)
+    except asyncio.TimeoutError:
+        print(f"Session context timed out after {SESSION_CONTEXT_TIMEOUT}s")
+        return "No previous context.", []
 
+async def _timed(stage, timings, coro, parent=None):
+    started = time.perf_counter()
     try:
-        relevant_names = select_relevant_tables(user_query, all_configs)
-        print(f" Selected Tables: {relevant_names}")
-
-        if not relevant_names or (len(relevant_names) == 1 and "none" in relevant_names[0].lower()):
-            print(" No relevant tables found (Query is likely for RAG/General).")
-            return "No relevant data found in the database. This query might be better suited for the Manuals/RAG."
-            
-        if len(relevant_names) == 1 and "general" in relevant_names[0].lower():
-            print(" Detected General Query. Proceeding without specific tables.")
-            relevant_names = []
-            
-    except Exception as e:
-        print(f"Routing Error: {e}")
-        return "Error in routing."
-    
-    api_map = {api.config.name: api for api in all_apis}
-    selected_tools = [db_manager.get_master_sql_tool()]
-    
-    for name in relevant_names:
-        clean_name = name.strip()
-        if clean_name in api_map:
-            selected_tools.append(api_map[clean_name].get_schema_tool())
+        with tracer.span(f"prepare.{stage}", parent=parent):
+            return await coro
+    finally:
+        timings[stage] = round(time.perf_counter() - started, 3)
+
+def _start_prepare(user_query, session_id, history, parent=None):
+    # Memory search, session context and routing are independent; run them side by side so the
+    # pre-agent wait is the slowest stage rather than the sum. Each stage degrades on its own
+    # timeout; only a routing decision of "None" or a routing error stops the request.
+    timings = {}
+    return {
+        "started": time.perf_counter(),
+        "timings": timings,
+        "facts": asyncio.ensure_future(_timed("memory_search", timings, _semantic_facts(user_query, session_id), parent)),
+        "context": asyncio.ensure_future(_timed("session_context", timings, _session_history(session_id, history), parent)),
+        "routing": asyncio.ensure_future(_timed("routing", timings, _route(user_query), parent)),
+    }
+
+def _cancel_prepare(stages):
+    for key in ("facts", "context", "routing"):
+        task = stages[key]
+        task.cancel()
+        # Retrieve the outcome so a stage that already failed is not reported as never retrieved
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+async def _prepare(stages):
+    try:
+        relevant_names = await stages["routing"]
+    except EarlyResponse:
+        _cancel_prepare(stages)
+        raise
+
+    semantic_facts, (past_summary, recent_chat_history) = await asyncio.gather(stages["facts"], stages["context"])
+    print(f" Pre-agent stages: {stages['timings']} (wall {time.perf_counter() - stages['started']:.3f}s)")
+    return relevant_names, semantic_facts, past_summary, recent_chat_history
 
-    prompt = ChatPromptTemplate.from_messages([
+def _agent_prompt(language):
+    return ChatPromptTemplate.from_messages([
         ("system", 
          "You are a SQL Data Agent. Respond to welcome messages with a welcome message. "
          "1. Schema Tools: Use 'describe_<table_name>' tools (e.g. 'describe_equipment') to get table schemas. "
@@ -236,53 +483,350 @@ def run_agent(user_query, session_id="default", history=[], language="Default En
          "   - Map 'Category:' to 'Category' columns. "
          "   - Do NOT assume columns are named 'Entity' or 'Category' without checking the schema."
          f"\n 10. **LANGUAGE RULE**: You MUST provide your final response in {language}, using conversational/daily language. DO NOT use overly formal language."
+         "\n 11. **PRELOADED SCHEMAS**: Tables listed under PRELOADED SCHEMAS below are already described. Query them directly and DO NOT call their 'describe_...' tool."
+         "\n 12. **NAMED ITEMS**: When the user names a specific item (possibly partially or misspelled), call 'find_entity' once and filter your SQL on the primary key it returns instead of trying several LIKE '%...%' queries."
          "\n\n--- CONTEXT ---"
          "\nOLDER CONVERSATION SUMMARY: {past_summary}"
          "\nSPECIFIC RELEVANT FACTS: {semantic_facts}"
          "\n(Note: Ignore 'semantic_facts' if they come from RAG/Web sources)"
+         "\nPRELOADED SCHEMAS:\n{schema_context}"
         ),
         ("placeholder", "{chat_history}"), 
         ("human", "{input}"),
         ("placeholder", "{agent_scratchpad}"),
     ])
 
-    agent = create_tool_calling_agent(llm, selected_tools, prompt)
-    agent_executor = AgentExecutor(agent=agent, tools=selected_tools, verbose=True)
-    
-    response = agent_executor.invoke({
-        "input": user_query, 
+# Tools are compiled once per config load and executors once per (table set, language);
+# AgentExecutor keeps no per-run state, so concurrent requests share them.
+class AgentRegistry:
+    def __init__(self, max_executors=64):
+        self.executors = LRUCache(max_entries=max_executors)
+        self.generation = 0
+        self._lock = threading.Lock()
+        self.llm = None
+        self.sql_tool = None
+        self.entity_tool = None
+        self.schema_tools = {}
+
+    def rebuild(self, apis, llm):
+        sql_tool = db_manager.get_master_sql_tool()
+        entity_tool = db_manager.get_find_entity_tool()
+        schema_tools = {api.config.name: api.get_schema_tool(db_manager.schema_card) for api in apis}
+        with self._lock:
+            self.llm = llm
+            self.sql_tool = sql_tool
+            self.entity_tool = entity_tool
+            self.schema_tools = schema_tools
+            self.generation += 1
+        self.executors.clear()
+
+    def compile(self, table_names, language):
+        tools = [self.sql_tool, self.entity_tool] + [self.schema_tools[name] for name in table_names]
+        agent = create_tool_calling_agent(self.llm, tools, _agent_prompt(language))
+        return AgentExecutor(agent=agent, tools=tools, verbose=True, return_intermediate_steps=True)
+
+    def executor(self, relevant_names, language):
+        table_names = tuple(sorted({name.strip() for name in relevant_names if name.strip() in self.schema_tools}))
+        key = (self.generation, table_names, language)
+        executor = self.executors.get(key)
+        if executor is None:
+            executor = self.compile(table_names, language)
+            self.executors.put(key, executor)
+        return executor
+
+    def stats(self):
+        return {"generation": self.generation, "tools": len(self.schema_tools) + 2, "executors": self.executors.stats()}
+
+agent_registry = AgentRegistry()
+agent_registry.rebuild(all_apis, llm)
+
+def _build_executor(relevant_names, language):
+    return agent_registry.executor(relevant_names, language)
+
+SCHEMA_PRELOAD = os.environ.get("SCHEMA_PRELOAD", "1").lower() not in ("0", "false", "no")
+SCHEMA_PRELOAD_TOKENS = int(os.environ.get("SCHEMA_PRELOAD_TOKENS", "3000"))
+preload_totals = Counter()
+
+def _estimate_tokens(text):
+    # Close enough for budgeting English/SQL text without loading a tokenizer
+    return (len(text) + 3) // 4
+
+PROMPT_BASE_TOKENS = _estimate_tokens(_agent_prompt("").messages[0].prompt.template)
+
+def _schema_context(relevant_names):
+    # Selected tables' schema text, in routing order, for as many tables as fit the budget;
+    # the rest are left to their describe_ tools
+    if not SCHEMA_PRELOAD:
+        return "None. Use the 'describe_...' tools.", [], 0
+    api_map = {api.config.name: api for api in all_apis}
+    blocks, preloaded, tokens = [], [], 0
+    for name in relevant_names:
+        api = api_map.get(name.strip())
+        card = db_manager.schema_card(api.safe_name) if api else None
+        if not card:
+            continue
+        block = api._get_schema_details("", card)
+        cost = _estimate_tokens(block)
+        if tokens + cost > SCHEMA_PRELOAD_TOKENS:
+            continue
+        blocks.append(block)
+        preloaded.append(api.safe_name)
+        tokens += cost
+    if not blocks:
+        return "None. Use the 'describe_...' tools.", [], 0
+    return "\n".join(blocks), preloaded, tokens
+
+def _agent_inputs(user_query, past_summary, semantic_facts, recent_chat_history, schema_context):
+    return {
+        "input": user_query,
         "past_summary": past_summary,
         "semantic_facts": semantic_facts,
-        "chat_history": recent_chat_history
+        "chat_history": recent_chat_history,
+        "schema_context": schema_context
+    }
+
+def _preload_report(inputs, preloaded, schema_tokens, tools_called):
+    # Every describe_ call skipped is one agent iteration less, and each iteration resends
+    # the whole prompt; the estimate counts the prompt as sent on the first iteration
+    described = {tool[len("describe_"):] for tool in tools_called if tool.startswith("describe_")}
+    skipped = [name for name in preloaded if name not in described]
+    prompt_tokens = PROMPT_BASE_TOKENS + sum(
+        _estimate_tokens(str(getattr(v, "content", v))) for value in inputs.values()
+        for v in (value if isinstance(value, list) else [value])
+    )
+    report = {
+        "preloaded": preloaded,
+        "schema_tokens": schema_tokens,
+        "describe_calls": sum(1 for tool in tools_called if tool.startswith("describe_")),
+        "iterations": len(tools_called) + 1,
+        "iterations_saved": len(skipped),
+        "tokens_saved_estimate": len(skipped) * prompt_tokens,
+    }
+    preload_totals.update({
+        "queries": 1,
+        "preloaded_tables": len(preloaded),
+        "describe_calls": report["describe_calls"],
+        "iterations_saved": report["iterations_saved"],
+        "tokens_saved_estimate": report["tokens_saved_estimate"],
     })
-    
-    result_text = response['output']
-    
-    sql_log = ""
-    for step in response.get("intermediate_steps", []):
-        tool_name = step[0].tool
-        if tool_name == "execute_global_sql":
-            query = step[0].tool_input
-            res = step[1]
-            sql_log += f"\n[SQL EXECUTED]: {query}\n[RESULT]: {str(res)[:500]}..." 
+    print(f" Schema preload: {report}")
+    return report
+
+def _sql_log_entry(query, res):
+    return f"\n[SQL EXECUTED]: {query}\n[RESULT]: {str(res)[:500]}..."
 
+def _sql_row_count(res):
+    try:
+        result = json.loads(res)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(result, dict):
+        return None
+    return result.get("total_rows") or result.get("row_count")
+
+async def _remember(user_query, session_id, result_text, sql_log):
     try:
         memory_content = f"User: {user_query}\nAssistant: {result_text}"
         if sql_log:
             memory_content += f"\nDETAILS:{sql_log}"
-            
-        memory.add(memory_content, user_id=session_id, metadata={"role": "interaction"}, infer=False)
+
+        # Queued, not written: the response does not wait for the embedding call and vector store
+        memory_writes.add(memory_content, session_id, metadata={"role": "interaction"})
     except Exception as e:
         print(f" Memory Update Error: {e}")
 
+async def _embed_question(user_query):
+    embedder = getattr(memory, "embedding_model", None)
+    if embedder is None:
+        return None
+    try:
+        return await asyncio.wait_for(run_blocking(embedder.embed, user_query, "search"), ANSWER_CACHE_EMBED_TIMEOUT)
+    except Exception as e:
+        print(f"Answer cache embedding failed: {e!r}")
+        return None
+
+async def _cached_answer(user_query, history, language, stages, parent=None):
+    # Returns (cached result or None, probe). The probe is what _store_answer needs later and is
+    # None when the question must neither be answered from nor stored in the cache.
+    # Answers are shared across sessions, so only questions asked without any conversation
+    # behind them qualify: "and for Pune?" means something different in every session. The
+    # session context comes from the prepare stages, which are already running alongside.
+    if history or not ANSWER_CACHE or not db_manager.version or not answer_cache.cacheable(user_query):
+        return None, None
+    past_summary, recent_chat_history = await stages["context"]
+    if past_summary or recent_chat_history:
+        return None, None
+    with tracer.span("answer_cache.lookup", parent=parent) as span:
+        version = db_manager.version
+        entry = answer_cache.get(version, language, user_query)
+        match, score, vector = "exact", 1.0, None
+        if entry is None and answer_cache.semantic:
+            vector = await _embed_question(user_query)
+            found = answer_cache.similar(version, language, vector) if vector is not None else None
+            if found is not None:
+                (entry, score), match = found, "similar"
+        span.set(hit=entry is not None, match=match if entry is not None else None)
+    if entry is None:
+        return None, (version, vector)
+
+    print(f" Answer cache hit ({match}, similarity {score:.3f}, data version {version})")
     return {
-        "response": result_text,
-        "sql_log": sql_log if sql_log else None
-    }
+        "response": entry["response"],
+        "sql_log": entry["sql_log"],
+        "cached": True,
+        "answer_cache": {"match": match, "similarity": round(score, 3), "data_version": version,
+                         "tables": entry["tables"], "age_seconds": round(time.time() - entry["stored_at"], 1)}
+    }, None
+
+def _store_answer(probe, user_query, language, tables, result_text, sql_log):
+    # Only answers backed by SQL that ran cleanly; chat replies and failed queries are not reused
+    if probe is None or not sql_log or "SQL Error" in sql_log:
+        return
+    version, vector = probe
+    entry = {"response": result_text, "sql_log": sql_log, "tables": tables, "stored_at": time.time()}
+    answer_cache.put(version, language, user_query, entry, vector)
+
+async def arun_agent(user_query, session_id="default", history=[], language="Default English"):
+    print(f" User Query: {user_query} (Session: {session_id}, Language: {language})")
+
+    with tracer.span("agent.run", session_id=session_id, language=language) as root:
+        stages = _start_prepare(user_query, session_id, history)
+        try:
+            cached, probe = await _cached_answer(user_query, history, language, stages)
+        except BaseException:
+            _cancel_prepare(stages)
+            raise
+        if cached is not None:
+            _cancel_prepare(stages)
+            root.set(answer_cache=cached["answer_cache"]["match"])
+            with tracer.span("memory.add"):
+                await _remember(user_query, session_id, cached["response"], cached["sql_log"])
+            return cached
+
+        try:
+            relevant_names, semantic_facts, past_summary, recent_chat_history = await _prepare(stages)
+        except EarlyResponse as early:
+            root.set(early_response=True)
+            return {"response": early.response, "sql_log": None}
+
+        agent_executor = _build_executor(relevant_names, language)
+        schema_context, preloaded, schema_tokens = _schema_context(relevant_names)
+        inputs = _agent_inputs(user_query, past_summary, semantic_facts, recent_chat_history, schema_context)
+        with tracer.span("agent.executor", tables=relevant_names, preloaded=preloaded):
+            response = await agent_executor.ainvoke(inputs, config={"callbacks": [SpanCallbackHandler(tracer, "agent")]})
+
+        result_text = response['output']
+
+        sql_log = ""
+        tools_called = []
+        for step in response.get("intermediate_steps", []):
+            tool_name = step[0].tool
+            tools_called.append(tool_name)
+            if tool_name == "execute_global_sql":
+                sql_log += _sql_log_entry(step[0].tool_input, step[1])
+
+        with tracer.span("memory.add"):
+            await _remember(user_query, session_id, result_text, sql_log)
+        _store_answer(probe, user_query, language, relevant_names, result_text, sql_log)
+
+        return {
+            "response": result_text,
+            "sql_log": sql_log if sql_log else None,
+            "schema_preload": _preload_report(inputs, preloaded, schema_tokens, tools_called)
+        }
+
+async def astream_agent(user_query, session_id="default", history=[], language="Default English"):
+    # Yields (event, data) pairs as the agent works: routing, tool_start, tool_end, token, done
+    print(f" Streaming Query: {user_query} (Session: {session_id}, Language: {language})")
+
+    # A generator cannot keep a span current across its yields, so stages get the root explicitly
+    root = tracer.start_span("agent.stream", session_id=session_id, language=language)
+    error = None
+    try:
+        async for item in _astream_events(user_query, session_id, history, language, root):
+            yield item
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        tracer.end_span(root, error=error)
+
+async def _astream_events(user_query, session_id, history, language, root):
+    stages = _start_prepare(user_query, session_id, history, root)
+    try:
+        cached, probe = await _cached_answer(user_query, history, language, stages, root)
+    except BaseException:
+        _cancel_prepare(stages)
+        raise
+    if cached is not None:
+        _cancel_prepare(stages)
+        root.set(answer_cache=cached["answer_cache"]["match"])
+        yield "routing", {"tables": cached["answer_cache"]["tables"], "cached": True}
+        with tracer.span("memory.add", parent=root):
+            await _remember(user_query, session_id, cached["response"], cached["sql_log"])
+        yield "done", cached
+        return
+
+    try:
+        relevant_names, semantic_facts, past_summary, recent_chat_history = await _prepare(stages)
+    except EarlyResponse as early:
+        root.set(early_response=True)
+        yield "routing", {"tables": None}
+        yield "done", {"response": early.response, "sql_log": None}
+        return
+    yield "routing", {"tables": relevant_names}
+
+    agent_executor = _build_executor(relevant_names, language)
+    schema_context, preloaded, schema_tokens = _schema_context(relevant_names)
+    inputs = _agent_inputs(user_query, past_summary, semantic_facts, recent_chat_history, schema_context)
+
+    tools_called = []
+    sql_log = ""
+    streamed = ""
+    result_text = None
+    pending_inputs = {}
+    callbacks = [SpanCallbackHandler(tracer, "agent", parent=root)]
+    async for event in agent_executor.astream_events(inputs, version="v2", config={"callbacks": callbacks}):
+        kind = event["event"]
+        if kind == "on_chain_stream" and event["name"] == "AgentExecutor":
+            chunk = event["data"].get("chunk") or {}
+            for action in chunk.get("actions", []):
+                tools_called.append(action.tool)
+                pending_inputs.setdefault(action.tool, []).append(action.tool_input)
+                yield "tool_start", {"tool": action.tool, "input": action.tool_input}
+            if "output" in chunk:
+                result_text = chunk["output"]
+        elif kind == "on_tool_end":
+            output = event["data"].get("output")
+            output = getattr(output, "content", output)
+            queued = pending_inputs.get(event["name"]) or [None]
+            tool_input = queued.pop(0)
+            data = {"tool": event["name"]}
+            if event["name"] == "execute_global_sql":
+                sql_log += _sql_log_entry(tool_input, output)
+                data["rows"] = _sql_row_count(output)
+                data["error"] = output if isinstance(output, str) and output.startswith("SQL Error") else None
+            yield "tool_end", data
+        elif kind == "on_chat_model_stream":
+            chunk = event["data"]["chunk"]
+            if isinstance(chunk.content, str) and chunk.content and not chunk.tool_call_chunks:
+                streamed += chunk.content
+                yield "token", {"text": chunk.content}
+
+    result_text = result_text if result_text is not None else streamed
+    with tracer.span("memory.add", parent=root):
+        await _remember(user_query, session_id, result_text, sql_log)
+    _store_answer(probe, user_query, language, relevant_names, result_text, sql_log)
+    yield "done", {"response": result_text, "sql_log": sql_log if sql_log else None,
+                   "schema_preload": _preload_report(inputs, preloaded, schema_tokens, tools_called)}
 
 def reload_agent_config():
-    global all_configs, all_apis, db_manager
+    global all_configs, all_apis, config_mtime
     print("Reloading API configurations:")
     all_configs, all_apis = load_api_configs()
-    db_manager = GlobalDataManager(all_apis)
-    print("API configurations reloaded.")
\ No newline at end of file
+    config_mtime = _config_mtime()
+    db_manager.reconfigure(all_apis)
+    rebuild_table_router()
+    answer_cache.clear()
+    agent_registry.rebuild(all_apis, llm)
+    print("API configurations reloaded. Data is refreshing in the background.")
\ No newline at end of file
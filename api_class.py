@@ -1,5 +1,7 @@
+import json
 import requests
-from typing import List, Dict, Optional, Union
+from typing import Callable, List, Dict, Iterator, Optional, Union
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
 from langchain_core.tools import Tool, StructuredTool
 from pydantic import BaseModel
 
@@ -9,13 +11,21 @@ class APITableConfig:
                  description: str,
                  pk: Union[str, List[str]], 
                  relationships: List[Dict] = None,
-                 name_field: Optional[str] = None):
+                 name_field: Optional[str] = None,
+                 modified_field: Optional[str] = None,
+                 indexes: Optional[List[Union[str, List[str]]]] = None,
+                 search_fields: Optional[List[str]] = None,
+                 column_types: Optional[Dict[str, str]] = None):
         
         self.name = name
         self.description = description
         self.pk = pk if isinstance(pk, list) else [pk]
         self.relationships = relationships or []
         self.name_field = name_field 
+        self.modified_field = modified_field
+        self.indexes = [ix if isinstance(ix, list) else [ix] for ix in (indexes or [])]
+        self.search_fields = list(search_fields or [])
+        self.column_types = dict(column_types or {})     # column -> "kind[:format]", e.g. "date:%d/%m/%Y"
 
 class APILookup:
     def __init__(self, 
@@ -24,7 +34,10 @@ class APILookup:
                  json_key: str = "data", 
                  headers: Optional[Dict] = None, 
                  payload: Optional[Dict] = None, 
-                 method: str = "POST"):
+                 method: str = "POST",
+                 timeout: float = 10,
+                 pagination: Optional[Dict] = None,
+                 modified_since_param: Optional[str] = None):
         
         self.config = config
         self.url = url
@@ -32,33 +45,83 @@ class APILookup:
         self.headers = headers or {"Content-Type": "application/json"}
         self.payload = payload or {}
         self.method = method.upper()
-        self._cache = None
+        self.timeout = timeout
+        self.pagination = pagination
+        self.modified_since_param = modified_since_param
+        self._sample = None
+        self.last_error = None
         self.safe_name = self.config.name.lower().replace(" ", "_")
 
-    def _fetch_data(self) -> List[Dict]:
-        if self._cache is not None: return self._cache
+    def _request(self, http, url: str) -> List[Dict]:
+        if self.method == "POST":
+            r = http.post(url, json=self.payload, headers=self.headers, verify=False, timeout=self.timeout)
+        else:
+            r = http.get(url, headers=self.headers, params=self.payload, verify=False, timeout=self.timeout)
 
+        if r.status_code != 200:
+            raise RuntimeError(f"HTTP {r.status_code}")
+        raw_list = r.json().get(self.json_key, []) or []
+        return [item for item in raw_list if isinstance(item, dict)]
+
+    def _build_url(self, page: Optional[int] = None, params: Optional[Dict] = None) -> str:
+        if page is None and not params:
+            return self.url
+        parts = urlparse(self.url)
+        query = dict(parse_qsl(parts.query, keep_blank_values=True))
+        if page is not None:
+            p = self.pagination
+            query[p.get("page_param", "page")] = str(page)
+            query[p.get("size_param", "per_page")] = str(p.get("page_size", 1000))
+        query.update({k: str(v) for k, v in (params or {}).items()})
+        return urlunparse(parts._replace(query=urlencode(query)))
+
+    def iter_pages(self, session: Optional[requests.Session] = None, params: Optional[Dict] = None) -> Iterator[List[Dict]]:
+        http = session or requests
+        self.last_error = None
+        if not self.pagination:
+            try:
+                rows = self._request(http, self._build_url(params=params))
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                return
+            if rows:
+                self._sample = [{"details": row} for row in rows[:3]]
+                yield rows
+            return
+
+        page = self.pagination.get("start_page", 1)
+        max_pages = self.pagination.get("max_pages")
+        fetched, full_size, prev_first = 0, 0, None
         try:
-            if self.method == "POST":
-                r = requests.post(self.url, json=self.payload, headers=self.headers, verify=False, timeout=10)
-            else:
-                r = requests.get(self.url, headers=self.headers, params=self.payload, verify=False, timeout=10)
-            
-            if r.status_code != 200: return []
-            raw_list = r.json().get(self.json_key, []) or []
-            
-            cleaned_list = []
-            for item in raw_list:
-                if isinstance(item, dict):
-                    entry = {"details": item}
-                    cleaned_list.append(entry)
-            
-            self._cache = cleaned_list
-            return cleaned_list
-        except Exception:
-            return []
+            while max_pages is None or fetched < max_pages:
+                rows = self._request(http, self._build_url(page, params))
+                if not rows:
+                    break
+
+                # Some endpoints ignore the page parameter and repeat the first page forever
+                first = json.dumps(rows[0], sort_keys=True, default=str)
+                if first == prev_first:
+                    break
+                prev_first = first
 
-    def _get_schema_details(self, input_str: str = ""):
+                if fetched == 0:
+                    self._sample = [{"details": row} for row in rows[:3]]
+                yield rows
+                fetched += 1
+
+                # A short page after a full one is the last; servers may cap page_size below what we asked for
+                if len(rows) < full_size:
+                    break
+                full_size = max(full_size, len(rows))
+                page += 1
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+
+    def _sample_rows(self) -> List[Dict]:
+        # Only what the last load kept; describing a table never calls the upstream API
+        return self._sample or []
+
+    def _get_schema_details(self, input_str: str = "", card: Optional[str] = None):
         c = self.config
         info = f"TABLE: {self.safe_name}\nDESCRIPTION: {c.description}\n"
         info += f"PRIMARY KEY: {', '.join(c.pk)}\n"
@@ -72,8 +135,12 @@ class APILookup:
                 my_cols = ", ".join(rel['my_cols'])
                 target_cols = ", ".join(rel['target_cols'])
                 info += f"  - JOIN {self.safe_name}.{my_cols} = {rel['target_table']}.{target_cols}\n"
-        
-        data = self._fetch_data()
+
+        # Precomputed from the loaded table at refresh time; the API sample is only a fallback
+        if card:
+            return info + card
+
+        data = self._sample_rows()
         if data:
             requested_attrs = self.payload.get("attributes", [])
             
@@ -93,18 +160,20 @@ class APILookup:
             for i, row in enumerate(examples, 1):
                 filtered_row = {k: row['details'].get(k, "N/A") for k in display_cols if k in row['details']}
                 info += f"Row {i}: {filtered_row}\n"
+        else:
+            info += "\nThe data for this table is still loading; its columns are not known yet. Try again shortly.\n"
             
         return info
 
-    def _get_schema_details_no_args(self) -> str:
-        return self._get_schema_details("")
-
-    def get_schema_tool(self) -> StructuredTool:
+    def get_schema_tool(self, card_source: Optional[Callable[[str], Optional[str]]] = None) -> StructuredTool:
         class NoInputModel(BaseModel):
             pass
 
+        def describe() -> str:
+            return self._get_schema_details("", card_source(self.safe_name) if card_source else None)
+
         return StructuredTool.from_function(
-            func=self._get_schema_details_no_args,
+            func=describe,
             name=f"describe_{self.safe_name}",
             description=f"Returns the database schema and sample rows for the '{self.config.name}' table. Use this to understand the columns before querying.",
             args_schema=NoInputModel
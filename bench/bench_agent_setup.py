@@ -0,0 +1,77 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("APP_DATA_DIR", tempfile.mkdtemp(prefix="api_agent_bench_"))
+os.environ.setdefault("MEM0_TELEMETRY", "False")
+
+import api_agent
+from api_class import APILookup, APITableConfig
+from bench.fakes import FakeChatModel
+
+TABLE_SETS = [["Equipment"], ["Spares", "Equipment"], ["Assets"], []]
+LANGUAGES = ["Default English", "Hindi"]
+
+
+# Per-request setup as it was before the registry: fresh tools, prompt, agent and executor
+def uncached_setup(apis, llm, relevant_names, language):
+    api_map = {api.config.name: api for api in apis}
+    tools = [api_agent.db_manager.get_master_sql_tool()]
+    for name in relevant_names:
+        if name.strip() in api_map:
+            tools.append(api_map[name.strip()].get_schema_tool())
+    agent = api_agent.create_tool_calling_agent(llm, tools, api_agent._agent_prompt(language))
+    return api_agent.AgentExecutor(agent=agent, tools=tools, verbose=True, return_intermediate_steps=True)
+
+
+def measure(setup, iterations):
+    times = []
+    tracemalloc.start()
+    for i in range(iterations):
+        names = TABLE_SETS[i % len(TABLE_SETS)]
+        language = LANGUAGES[i % len(LANGUAGES)]
+        start = time.perf_counter()
+        setup(names, language)
+        times.append(time.perf_counter() - start)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    times.sort()
+    return {
+        "p50_us": round(statistics.median(times) * 1e6, 1),
+        "p95_us": round(times[int(len(times) * 0.95) - 1] * 1e6, 1),
+        "total_ms": round(sum(times) * 1000, 1),
+        "peak_alloc_kb": round(peak / 1024, 1),
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Per-request agent setup cost with and without the registry.")
+    parser.add_argument("--iterations", type=int, default=400)
+    args = parser.parse_args()
+
+    configs = [APITableConfig(name=name, description=f"{name} master", pk="id", name_field="Name")
+               for name in ("Equipment", "Spares", "Assets")]
+    apis = [APILookup(config=c, url=f"http://127.0.0.1:9/{c.name.lower()}") for c in configs]
+    llm = FakeChatModel()
+    api_agent.db_manager.apis = apis
+    api_agent.agent_registry.rebuild(apis, llm)
+
+    result = {
+        "iterations": args.iterations,
+        "uncached": measure(lambda names, language: uncached_setup(apis, llm, names, language), args.iterations),
+        "registry": measure(api_agent.agent_registry.executor, args.iterations),
+        "registry_stats": api_agent.agent_registry.stats(),
+    }
+    result["speedup_p50"] = round(result["uncached"]["p50_us"] / max(result["registry"]["p50_us"], 0.001), 1)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,82 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ.setdefault("APP_DATA_DIR", tempfile.mkdtemp(prefix="api_agent_bench_"))
+os.environ.setdefault("MEM0_TELEMETRY", "False")
+
+import httpx
+
+import api_agent
+import main
+from api_class import APILookup, APITableConfig
+from bench.fakes import FakeChatModel, FakeMemory
+from bench.stub_api import StubAPIServer, make_rows
+
+
+async def timed(client, method, url, **kwargs):
+    start = time.perf_counter()
+    response = await client.request(method, url, **kwargs)
+    return response.status_code, time.perf_counter() - start
+
+
+async def run(args):
+    fake_memory = FakeMemory(delay=args.memory_delay)
+    api_agent.llm = FakeChatModel(delay=args.llm_delay)
+    api_agent.agent_registry.rebuild(api_agent.all_apis, api_agent.llm)
+    api_agent.memory = fake_memory
+    api_agent.memory_writes.memory = fake_memory
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        chats = [
+            timed(client, "POST", "/chat", json={"message": f"how many equipment? #{i}", "session_id": f"s{i % 4}"})
+            for i in range(args.chats)
+        ]
+        chat_tasks = [asyncio.create_task(c) for c in chats]
+        await asyncio.sleep(args.llm_delay / 2)
+        statics = await asyncio.gather(*[timed(client, "GET", "/static/css/style.css") for _ in range(args.statics)])
+        chat_results = await asyncio.gather(*chat_tasks)
+
+    chat_times = [t for code, t in chat_results if code == 200]
+    static_times = [t for _, t in statics]
+    return {
+        "chats": args.chats,
+        "chat_ok": len(chat_times),
+        "chat_429": sum(1 for code, _ in chat_results if code == 429),
+        "chat_p50_s": round(statistics.median(chat_times), 3) if chat_times else None,
+        "chat_max_s": round(max(chat_times), 3) if chat_times else None,
+        "static_p50_ms": round(statistics.median(static_times) * 1000, 1),
+        "static_max_ms": round(max(static_times) * 1000, 1),
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Check that slow chats no longer block other requests.")
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--statics", type=int, default=20)
+    parser.add_argument("--llm-delay", type=float, default=0.5)
+    parser.add_argument("--memory-delay", type=float, default=0.05)
+    args = parser.parse_args()
+
+    with StubAPIServer({"equipment": make_rows("equipment", 1000)}) as server:
+        config = APITableConfig(name="Equipment", description="Equipment master", pk="Unique_No", name_field="Name")
+        api_agent.all_configs = [config]
+        api_agent.all_apis = [APILookup(config=config, url=server.url("equipment"))]
+        api_agent.db_manager.apis = api_agent.all_apis
+        api_agent.db_manager.refresh_data()
+        result = asyncio.run(run(args))
+
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
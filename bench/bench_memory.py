@@ -0,0 +1,86 @@
+import argparse
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
+from api_class import APILookup, APITableConfig
+from sql_memdb import GlobalDataManager
+from bench.stub_api import StubAPIServer, make_rows
+
+KINDS = {"equipment": "Unique_No", "spares": "JDE_Item_Code", "assets": "Unique_ID"}
+
+
+# The ingestion path as it was: the {"details": row} list cached on the API object for good,
+# a raw_rows copy and a DataFrame per table, then pandas to_sql into the in-memory database
+def legacy_load(server: StubAPIServer, rows: int) -> dict:
+    import pandas as pd
+
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    caches, report = {}, {}
+    for kind in KINDS:
+        gc.collect()
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        raw = requests.post(server.url(kind), json={}).json()
+        caches[kind] = [{"details": item} for item in raw.get("data", [])]
+        raw_rows = [item["details"] for item in caches[kind]]
+        df = pd.DataFrame(raw_rows)
+        df.to_sql(kind, engine, index=False, if_exists="replace")
+        peak = tracemalloc.get_traced_memory()[1]
+        del raw, raw_rows, df
+        gc.collect()
+        report[kind] = {"rows": rows, "peak_bytes": peak - before,
+                        "retained_bytes": tracemalloc.get_traced_memory()[0] - before}
+    return report
+
+
+def current_load(server: StubAPIServer, rows: int, page_size: int) -> dict:
+    pagination = {"page_param": "page", "size_param": "per_page", "page_size": page_size} if page_size else None
+    report = {}
+    for kind, pk in KINDS.items():
+        config = APITableConfig(name=kind.title(), description="bench", pk=pk)
+        api = APILookup(config=config, url=server.url(kind), pagination=pagination)
+        manager = GlobalDataManager([api], incremental=False)
+        gc.collect()
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        manager.refresh_data()
+        peak = tracemalloc.get_traced_memory()[1]
+        gc.collect()
+        memory = manager.memory_report()["tables"][kind]
+        report[kind] = {"rows": rows, "peak_bytes": peak - before,
+                        "retained_bytes": tracemalloc.get_traced_memory()[0] - before,
+                        "sqlite_bytes": memory["sqlite_bytes"], "api_retained_bytes": memory["api_retained_bytes"]}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-table Python heap used by ingestion, before and after streaming inserts.")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--page-size", type=int, default=5000, help="0 fetches each table in one response")
+    args = parser.parse_args()
+
+    datasets = {kind: make_rows(kind, args.rows) for kind in KINDS}
+    with StubAPIServer(datasets) as server:
+        tracemalloc.start()
+        try:
+            before = legacy_load(server, args.rows)
+        except ImportError:
+            before = "skipped (pandas is not installed)"
+        after = current_load(server, args.rows, args.page_size)
+        tracemalloc.stop()
+
+    # SQLite's own pages are allocated outside the Python heap and are not in these numbers
+    print(json.dumps({"before": before, "after": after}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
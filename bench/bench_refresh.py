@@ -0,0 +1,47 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_class import APILookup, APITableConfig
+from sql_memdb import GlobalDataManager
+from bench.stub_api import StubAPIServer, make_rows
+
+
+def build_apis(server: StubAPIServer, sources: int):
+    apis = []
+    for i in range(sources):
+        config = APITableConfig(name=f"Source {i}", description="stub source", pk="Unique_No")
+        apis.append(APILookup(config=config, url=server.url(f"source_{i}", per_page=100000, page=1)))
+    return apis
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time GlobalDataManager.refresh_data against a slow stub API.")
+    parser.add_argument("--sources", type=int, default=6)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    datasets = {f"source_{i}": make_rows("equipment", args.rows, seed=i) for i in range(args.sources)}
+    results = {}
+    with StubAPIServer(datasets, latency=args.latency) as server:
+        for label, workers in (("sequential", 1), ("concurrent", args.workers)):
+            manager = GlobalDataManager(build_apis(server, args.sources), max_workers=workers)
+            start = time.perf_counter()
+            manager.refresh_data()
+            results[label] = {
+                "workers": workers,
+                "seconds": round(time.perf_counter() - start, 3),
+                "sources": manager.last_refresh_report,
+            }
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
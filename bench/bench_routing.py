@@ -0,0 +1,120 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("APP_DATA_DIR", tempfile.mkdtemp(prefix="api_agent_bench_"))
+os.environ.setdefault("MEM0_TELEMETRY", "False")
+
+import api_agent
+from api_class import APILookup, APITableConfig
+from bench.fakes import FakeChatModel
+from bench.stub_api import StubAPIServer, make_rows
+from table_router import TableRouter
+
+# (query, expected tables); "General" means no table is needed, "None" means documents (RAG), not the database
+LABELLED_QUERIES = [
+    ("hi", ["General"]),
+    ("thanks", ["General"]),
+    ("How many equipments do we have?", ["Equipment"]),
+    ("List all equipment in the ACCESSORIES category", ["Equipment"]),
+    ("Which spare parts are used in Equipment 12?", ["Spares", "Equipment"]),
+    ("Show the spares for equipment 7", ["Spares", "Equipment"]),
+    ("How many spare parts are there?", ["Spares"]),
+    ("Give me the JDE item code of Spare part 15", ["Spares"]),
+    ("How many assets are in Mumbai?", ["Assets"]),
+    ("List inactive assets in Pune", ["Assets"]),
+    ("Which customers have assets under AMC contract?", ["Assets"]),
+    ("What is the status of Asset 42?", ["Assets"]),
+    ("Tell me about Spare part 3", ["Spares"]),
+    ("Which city has the most assets?", ["Assets"]),
+    ("Show assets and their equipment category", ["Assets", "Equipment"]),
+    ("What is the territory of Asset 8?", ["Assets"]),
+    ("How many active equipment are installed in Pune?", ["Assets", "Equipment"]),
+    ("Show me equipment manuals for CT scanner", ["None"]),
+    ("What are the technical specifications of the MRI equipment?", ["None"]),
+    ("How do I calibrate the ultrasound equipment?", ["None"]),
+]
+
+
+def load_configs():
+    with open(os.path.join(ROOT, "config.json")) as f:
+        items = json.load(f)
+    return [APITableConfig(name=i["name"], description=i["description"], pk=i["pk"],
+                           relationships=i.get("relationships", []), name_field=i.get("name_field")) for i in items]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+async def llm_route(query, configs):
+    start = time.perf_counter()
+    tables = await api_agent.aselect_relevant_tables(query, configs)
+    return [t.strip() for t in tables], time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare local+LLM routing with LLM-only routing.")
+    parser.add_argument("--live", action="store_true", help="use the configured Azure model instead of a fake one")
+    parser.add_argument("--llm-delay", type=float, default=0.6, help="latency of the fake router LLM")
+    args = parser.parse_args()
+
+    configs = load_configs()
+    if not args.live:
+        api_agent.llm = FakeChatModel(delay=args.llm_delay, tables=["Equipment"])
+
+    datasets = {"equipment": make_rows("equipment", 500), "spares": make_rows("spares", 2000), "assets": make_rows("assets", 3000)}
+    with StubAPIServer(datasets) as server:
+        apis = [APILookup(config=c, url=server.url(c.name.lower())) for c in configs]
+        api_agent.db_manager.apis = apis
+        api_agent.db_manager.refresh_data()
+
+    router = TableRouter()
+    names = {a.safe_name: api_agent.db_manager.distinct_values(a.safe_name, a.config.name_field) for a in apis}
+    router.build(configs, columns=api_agent.db_manager.table_columns(), names=names)
+
+    local_hits, local_correct, local_times, hybrid_times, llm_times, llm_correct = 0, 0, [], [], [], 0
+    misses = []
+    for query, expected in LABELLED_QUERIES:
+        start = time.perf_counter()
+        decision = router.route(query)
+        local_times.append(time.perf_counter() - start)
+        if decision is not None:
+            local_hits += 1
+            local_correct += sorted(decision) == sorted(expected)
+            if sorted(decision) != sorted(expected):
+                misses.append({"query": query, "expected": expected, "local": decision})
+            hybrid_times.append(local_times[-1])
+        else:
+            tables, elapsed = asyncio.run(llm_route(query, configs))
+            hybrid_times.append(local_times[-1] + elapsed)
+
+        tables, elapsed = asyncio.run(llm_route(query, configs))
+        llm_times.append(elapsed)
+        llm_correct += sorted(tables) == sorted(expected)
+
+    total = len(LABELLED_QUERIES)
+    print(json.dumps({
+        "queries": total,
+        "local_coverage": round(local_hits / total, 3),
+        "local_accuracy_when_confident": round(local_correct / local_hits, 3) if local_hits else None,
+        "llm_only_accuracy": round(llm_correct / total, 3) if args.live else "n/a (fake model)",
+        "local_route_p50_ms": round(statistics.median(local_times) * 1000, 3),
+        "hybrid_p50_ms": round(statistics.median(hybrid_times) * 1000, 1),
+        "hybrid_p95_ms": round(percentile(hybrid_times, 95) * 1000, 1),
+        "llm_only_p50_ms": round(statistics.median(llm_times) * 1000, 1),
+        "llm_only_p95_ms": round(percentile(llm_times, 95) * 1000, 1),
+        "local_misroutes": misses,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import asyncio
+import hashlib
+import itertools
+import math
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, SystemMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+# Deterministic stand-in for AzureChatOpenAI. It answers the router prompt with `tables`,
+# the summary prompt with a fixed summary, and drives the SQL agent through a describe_
+# call for every bound table whose schema is not already in the system prompt, one
+# execute_global_sql call and a final answer. `delay` is slept on every call.
+class FakeChatModel(BaseChatModel):
+    delay: float = 0.0
+    tables: List[str] = ["Equipment"]
+    sql: str = "SELECT COUNT(*) AS total FROM equipment"
+    calls: int = 0
+    tool_names: List[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        self.tool_names = [tool.name for tool in tools]
+        return self
+
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage:
+        self.calls += 1
+        system = messages[0].content if messages and isinstance(messages[0], SystemMessage) else ""
+        last = messages[-1] if messages else None
+
+        if "Database Router" in system:
+            return AIMessage(content=", ".join(self.tables) or "General")
+        if last is not None and "Summarize" in str(last.content) and not system:
+            return AIMessage(content="The user has been asking about equipment and spare parts.")
+        called = [call["name"] for m in messages if isinstance(m, AIMessage) for call in m.tool_calls]
+        if isinstance(last, ToolMessage) and "execute_global_sql" in called:
+            return AIMessage(content=f"Here is what I found: {str(last.content)[:200]}")
+        for tool in self.tool_names:
+            if tool.startswith("describe_") and tool not in called and f"TABLE: {tool[len('describe_'):]}\n" not in system:
+                return AIMessage(content="", tool_calls=[{"name": tool, "args": {}, "id": f"call_{self.calls}"}])
+        return AIMessage(content="", tool_calls=[{
+            "name": "execute_global_sql",
+            "args": {"__arg1": self.sql},
+            "id": f"call_{self.calls}",
+        }])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.delay:
+            time.sleep(self.delay)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    def _chunks(self, message: AIMessage):
+        if message.tool_calls:
+            call = message.tool_calls[0]
+            yield AIMessageChunk(content="", tool_call_chunks=[{
+                "name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": 0,
+            }])
+            return
+        for word in message.content.split(" "):
+            yield AIMessageChunk(content=word + " ")
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.delay:
+            time.sleep(self.delay)
+        for chunk in self._chunks(self._respond(messages)):
+            if run_manager and chunk.content:
+                run_manager.on_llm_new_token(chunk.content, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        for chunk in self._chunks(self._respond(messages)):
+            if run_manager and chunk.content:
+                await run_manager.on_llm_new_token(chunk.content, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+
+
+# Stand-in for mem0's embedding model (`memory.embedding_model`): hashed bag-of-words vectors,
+# so equal texts embed identically and texts sharing words land close together.
+class FakeEmbedder:
+    def __init__(self, dims: int = 1536, delay: float = 0.0):
+        self.dims = dims
+        self.delay = delay
+        self.calls = 0
+        self.config = None
+
+    def _vector(self, text: str) -> List[float]:
+        vector = [0.0] * self.dims
+        for word in str(text).lower().split():
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            slot = int.from_bytes(digest[:4], "little") % self.dims
+            vector[slot] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed(self, text, memory_action: Optional[str] = None) -> List[float]:
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return self._vector(text)
+
+    def embed_batch(self, texts, memory_action: Optional[str] = None) -> List[List[float]]:
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return [self._vector(text) for text in texts]
+
+
+# In-process replacement for mem0.Memory covering the calls api_agent and main make.
+class FakeMemory:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._items: Dict[str, List[dict]] = {}
+
+    def _sleep(self):
+        if self.delay:
+            time.sleep(self.delay)
+
+    def add(self, messages: Any, user_id: Optional[str] = None, metadata: Optional[dict] = None, infer: bool = True):
+        self._sleep()
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        added = []
+        with self._lock:
+            for message in messages:
+                item = {"id": str(next(self._ids)), "memory": message["content"], "metadata": metadata or {}}
+                self._items.setdefault(user_id, []).append(item)
+                added.append(item)
+        return {"results": added}
+
+    def get_all(self, user_id: Optional[str] = None, **kwargs):
+        self._sleep()
+        with self._lock:
+            return {"results": list(self._items.get(user_id, []))}
+
+    def search(self, query: str, user_id: Optional[str] = None, limit: int = 5, **kwargs):
+        self._sleep()
+        words = set(query.lower().split())
+        with self._lock:
+            items = list(self._items.get(user_id, []))
+        scored = [(len(words & set(item["memory"].lower().split())), item) for item in items]
+        return {"results": [item for score, item in sorted(scored, key=lambda x: -x[0])[:limit] if score]}
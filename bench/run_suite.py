@@ -0,0 +1,289 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.stub_api import StubAPIServer, make_rows, stub_config
+
+SCENARIOS = ("refresh", "sql", "agent", "chat")
+KINDS = ("equipment", "spares", "assets")
+
+JOIN_QUERIES = [
+    "SELECT e.Category_Code_2_Description, COUNT(*) AS spares FROM spares s "
+    "JOIN equipment e ON s.Equipment_ID = e.Unique_No GROUP BY e.Category_Code_2_Description",
+    "SELECT a.City, e.Category_Code_2_Description, COUNT(*) AS assets FROM assets a "
+    "JOIN equipment e ON a.Product_Name = e.Unique_No WHERE a.Equipment_Status = 'Active' GROUP BY 1, 2",
+    "SELECT e.Name, COUNT(s.JDE_Item_Code) AS spares FROM equipment e "
+    "LEFT JOIN spares s ON s.Equipment_ID = e.Unique_No GROUP BY e.Unique_No ORDER BY spares DESC LIMIT 10",
+    "SELECT a.Unique_ID, a.City, s.Name FROM assets a JOIN spares s ON s.Equipment_ID = a.Product_Name "
+    "WHERE a.Product_Name = 'EQ000042'",
+]
+
+AGENT_QUERIES = [
+    "how many spares does each equipment category have?",
+    "which equipment has the most spare parts?",
+    "active assets by city for Equipment 42",
+    "list spares for Equipment 7",
+]
+AGENT_SQL = JOIN_QUERIES[0]
+
+
+def percentiles(samples) -> dict:
+    # Milliseconds; p99 needs ~100 samples to mean much, the count is reported alongside
+    if not samples:
+        return {"count": 0}
+    ms = sorted(s * 1000 for s in samples)
+    if len(ms) > 1:
+        cuts = statistics.quantiles(ms, n=100, method="inclusive")
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = ms[0]
+    return {"count": len(ms), "p50_ms": round(p50, 3), "p95_ms": round(p95, 3), "p99_ms": round(p99, 3),
+            "min_ms": round(ms[0], 3), "max_ms": round(ms[-1], 3), "mean_ms": round(statistics.fmean(ms), 3)}
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def datasets(rows: int) -> dict:
+    return {kind: make_rows(kind, rows) for kind in KINDS}
+
+
+def build_apis(config):
+    from api_class import APILookup, APITableConfig
+
+    apis = []
+    for item in config:
+        table = APITableConfig(name=item["name"], description=item["description"], pk=item["pk"],
+                               relationships=item.get("relationships", []), name_field=item.get("name_field"),
+                               indexes=item.get("indexes"), search_fields=item.get("search_fields"),
+                               column_types=item.get("column_types"))
+        apis.append(APILookup(config=table, url=item["api_url"], pagination=item.get("pagination")))
+    return apis
+
+
+def scenario_refresh(args) -> dict:
+    from sql_memdb import GlobalDataManager
+
+    with StubAPIServer(datasets(args.rows), latency=args.api_latency) as server:
+        manager = GlobalDataManager(build_apis(stub_config(server, page_size=args.page_size)))
+        timings = {"full": [], "incremental": []}
+        for i in range(args.refreshes):
+            # The first pass loads everything; later ones find nothing changed upstream
+            incremental = i > 0
+            start = time.perf_counter()
+            manager.refresh_data(incremental=incremental)
+            timings["incremental" if incremental else "full"].append(time.perf_counter() - start)
+            if i == 0:
+                first = manager.last_refresh_report
+        return {"rows_per_table": args.rows, "upstream_requests": server.requests, "first_load": first,
+                "full": percentiles(timings["full"]), "incremental": percentiles(timings["incremental"])}
+
+
+def scenario_sql(args) -> dict:
+    from sql_memdb import GlobalDataManager
+
+    with StubAPIServer(datasets(args.rows)) as server:
+        manager = GlobalDataManager(build_apis(stub_config(server, page_size=args.page_size)))
+        manager.refresh_data()
+
+    cold, warm, per_query = [], [], {}
+    for _ in range(args.iterations):
+        for i, query in enumerate(JOIN_QUERIES):
+            manager.result_cache.clear()
+            start = time.perf_counter()
+            result = manager.run_global_sql(query)
+            elapsed = time.perf_counter() - start
+            if result.startswith("SQL Error"):
+                raise RuntimeError(f"{query}: {result}")
+            cold.append(elapsed)
+            per_query.setdefault(f"q{i + 1}", []).append(elapsed)
+            start = time.perf_counter()
+            manager.run_global_sql(query)
+            warm.append(time.perf_counter() - start)
+    return {"rows_per_table": args.rows, "queries": JOIN_QUERIES,
+            "uncached": percentiles(cold), "cached": percentiles(warm),
+            "per_query_uncached": {name: percentiles(samples) for name, samples in per_query.items()}}
+
+
+def _load_app(args, server):
+    # api_agent reads config.json from APP_DATA_DIR at import time, so it is written first
+    data_dir = tempfile.mkdtemp(prefix="api_agent_suite_")
+    os.environ["APP_DATA_DIR"] = data_dir
+    os.environ.setdefault("MEM0_TELEMETRY", "False")
+    # The scenarios repeat a handful of questions; left on, the cache would answer most of them
+    os.environ["ANSWER_CACHE"] = "1" if args.answer_cache else "0"
+    with open(os.path.join(data_dir, "config.json"), "w") as f:
+        json.dump(stub_config(server, page_size=args.page_size), f)
+
+    import api_agent
+    from bench.fakes import FakeChatModel, FakeEmbedder, FakeMemory
+
+    api_agent.db_manager.refresh_data()
+    api_agent.llm = FakeChatModel(delay=args.llm_delay, tables=["Equipment", "Spares"], sql=AGENT_SQL)
+    api_agent.agent_registry.rebuild(api_agent.all_apis, api_agent.llm)
+    if args.memory == "mem0":
+        # The real mem0 Memory (Chroma under APP_DATA_DIR) with only the embedding calls faked
+        api_agent.memory.embedding_model = FakeEmbedder(delay=args.memory_delay)
+    else:
+        api_agent.memory = FakeMemory(delay=args.memory_delay)
+        api_agent.memory_writes.memory = api_agent.memory
+    return api_agent
+
+
+def scenario_agent(args) -> dict:
+    with StubAPIServer(datasets(args.rows)) as server:
+        api_agent = _load_app(args, server)
+
+        async def run():
+            timings, calls, failures = [], [], 0
+            for i in range(args.iterations):
+                before = api_agent.llm.calls
+                start = time.perf_counter()
+                result = await api_agent.arun_agent(AGENT_QUERIES[i % len(AGENT_QUERIES)], session_id=f"agent-{i % 4}")
+                timings.append(time.perf_counter() - start)
+                calls.append(api_agent.llm.calls - before)
+                if not result.get("sql_log"):
+                    failures += 1
+            api_agent.memory_writes.flush(timeout=30)
+            return timings, calls, failures
+
+        timings, calls, failures = asyncio.run(run())
+    return {"rows_per_table": args.rows, "llm_delay_s": args.llm_delay, "memory": args.memory,
+            "latency": percentiles(timings), "llm_calls_per_request": round(statistics.fmean(calls), 2),
+            "requests_without_sql": failures, "memory_writes": api_agent.memory_writes.stats(),
+            "answer_cache": api_agent.answer_cache.stats()}
+
+
+def scenario_chat(args) -> dict:
+    import httpx
+
+    with StubAPIServer(datasets(args.rows)) as server:
+        api_agent = _load_app(args, server)
+        import main
+
+        async def run():
+            gate = asyncio.Semaphore(args.concurrency)
+
+            async def one(client, i):
+                async with gate:
+                    start = time.perf_counter()
+                    response = await client.post("/chat", json={
+                        "message": AGENT_QUERIES[i % len(AGENT_QUERIES)], "session_id": f"chat-{i % 8}"})
+                    return response.status_code, time.perf_counter() - start
+
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+                start = time.perf_counter()
+                results = await asyncio.gather(*[one(client, i) for i in range(args.chats)])
+                return results, time.perf_counter() - start
+
+        results, wall = asyncio.run(run())
+        api_agent.memory_writes.flush(timeout=30)
+
+    ok = [elapsed for code, elapsed in results if code == 200]
+    return {"rows_per_table": args.rows, "chats": args.chats, "concurrency": args.concurrency,
+            "llm_delay_s": args.llm_delay, "memory": args.memory, "ok": len(ok),
+            "rejected_429": sum(1 for code, _ in results if code == 429),
+            "errors": sum(1 for code, _ in results if code not in (200, 429)),
+            "throughput_rps": round(len(ok) / wall, 2) if wall else None,
+            "latency": percentiles(ok)}
+
+
+RUNNERS = {"refresh": scenario_refresh, "sql": scenario_sql, "agent": scenario_agent, "chat": scenario_chat}
+
+
+def run_child(args):
+    started = time.perf_counter()
+    result = RUNNERS[args.child](args)
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    result["peak_rss_mb"] = peak_rss_mb()
+    with open(args.result_file, "w") as f:
+        json.dump(result, f)
+
+
+# Each scenario runs in its own interpreter so its peak RSS is not inflated by the ones
+# before it, and so api_agent's import-time setup sees a fresh APP_DATA_DIR.
+def run_scenario(name, argv, verbose):
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        result_file = f.name
+    try:
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), *argv, "--child", name, "--result-file", result_file],
+            cwd=ROOT, stdout=None if verbose else subprocess.DEVNULL,
+            stderr=None if verbose else subprocess.PIPE, text=True
+        )
+        if proc.returncode != 0:
+            return {"error": f"exit code {proc.returncode}", "stderr": (proc.stderr or "")[-2000:]}
+        with open(result_file) as f:
+            return json.load(f)
+    finally:
+        os.unlink(result_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offline benchmarks against a stub upstream API, a fake chat model and fake memory.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument("--rows", type=int, default=20000, help="rows per table served by the stub")
+    parser.add_argument("--page-size", type=int, default=5000, help="0 fetches each table in one response")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="seconds the stub sleeps per response")
+    parser.add_argument("--refreshes", type=int, default=5)
+    parser.add_argument("--iterations", type=int, default=25, help="passes over the SQL queries / agent questions")
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-delay", type=float, default=0.05, help="seconds per fake LLM call")
+    parser.add_argument("--memory", choices=("fake", "mem0"), default="fake",
+                        help="fake: in-process FakeMemory; mem0: real mem0 with a fake embedder")
+    parser.add_argument("--memory-delay", type=float, default=0.0)
+    parser.add_argument("--answer-cache", action="store_true", help="keep the answer cache on for agent and chat")
+    parser.add_argument("--out", help="write the JSON results here as well as to stdout")
+    parser.add_argument("--verbose", action="store_true", help="show the scenarios' own output")
+    parser.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in RUNNERS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    passthrough = [arg for arg in sys.argv[1:] if arg != "--verbose"]
+    report = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "env": {"python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+                "platform": platform.platform(), "cpus": os.cpu_count()},
+        "params": {k: v for k, v in vars(args).items() if k not in ("child", "result_file", "out", "verbose")},
+        "scenarios": {},
+    }
+    for name in names:
+        print(f"Running {name}...", file=sys.stderr)
+        report["scenarios"][name] = run_scenario(name, passthrough, args.verbose)
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
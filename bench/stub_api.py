@@ -0,0 +1,128 @@
+import copy
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import urlparse, parse_qs
+
+
+def make_rows(kind: str, count: int, seed: int = 7) -> List[Dict]:
+    rnd = random.Random(seed)
+    categories = ["PRODUCTIVITY SW", "ACCESSORIES", "SPARES", "CONSUMABLES", "IMAGING"]
+    rows = []
+    for i in range(count):
+        if kind == "equipment":
+            rows.append({"Unique_No": f"EQ{i:06d}", "Name": f"Equipment {i}", "Category_Code_2_Description": rnd.choice(categories)})
+        elif kind == "spares":
+            rows.append({"JDE_Item_Code": f"SP{i:06d}", "Name": f"Spare part {i}", "Equipment_ID": f"EQ{rnd.randrange(max(1, count // 10)):06d}"})
+        else:
+            rows.append({"Unique_ID": f"AS{i:07d}", "Name": f"Asset {i}", "City": rnd.choice(["Mumbai", "Pune", "Delhi"]),
+                         "Product_Name": f"EQ{rnd.randrange(max(1, count // 10)):06d}", "Equipment_Status": rnd.choice(["Active", "Inactive"])})
+    return rows
+
+
+# The repo's config.json entries with api_url pointed at the stub (one dataset per table,
+# named after the lower-cased table name); pk, relationships and pagination are kept.
+def stub_config(server: "StubAPIServer", source: Optional[str] = None, page_size: Optional[int] = None) -> List[Dict]:
+    source = source or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.json")
+    with open(source) as f:
+        items = json.load(f)
+    config = []
+    for item in items:
+        item = copy.deepcopy(item)
+        kind = item["name"].lower().replace(" ", "_")
+        item["api_url"] = server.url(kind)
+        item.pop("payload", None)
+        if page_size is not None:
+            item["pagination"] = {"page_param": "page", "size_param": "per_page", "page_size": page_size} if page_size else None
+        config.append(item)
+    return config
+
+
+# Serves {"data": [...]} datasets in the config.json API shape, honouring per_page/page
+# and sleeping `latency` seconds (or a per-path override) before every response.
+class StubAPIServer:
+    def __init__(self, datasets: Dict[str, List[Dict]], latency: float = 0.0, latencies: Optional[Dict[str, float]] = None,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.datasets = datasets
+        self.latency = latency
+        self.latencies = latencies or {}
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, path: str, **params) -> str:
+        query = "&".join(f"{k}={v}" for k, v in params.items())
+        return f"{self.base_url}/{path.lstrip('/')}" + (f"?{query}" if query else "")
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _serve(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+
+                parsed = urlparse(self.path)
+                name = parsed.path.strip("/")
+                with server._lock:
+                    server.requests += 1
+
+                delay = server.latencies.get(name, server.latency)
+                if delay:
+                    time.sleep(delay)
+
+                if name not in server.datasets:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                rows = server.datasets[name]
+                params = parse_qs(parsed.query)
+                per_page = int(params.get("per_page", [len(rows) or 1])[0])
+                page = int(params.get("page", ["1"])[0])
+                chunk = rows[(page - 1) * per_page: page * per_page]
+
+                body = json.dumps({"data": chunk}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = _serve
+            do_POST = _serve
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "StubAPIServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
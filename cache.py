@@ -0,0 +1,92 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+def _default_sizeof(value: Any) -> int:
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    def __init__(self,
+                 max_entries: int = 256,
+                 max_bytes: Optional[int] = None,
+                 ttl: Optional[float] = None,
+                 sizeof: Optional[Callable[[Any], int]] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sizeof = sizeof or _default_sizeof
+        self._data = OrderedDict()    # key -> (value, size, stored_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl is not None and now - stored_at > self.ttl
+
+    def _remove(self, key: Hashable):
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or self._expired(item[2], time.monotonic()):
+                if item is not None:
+                    self._remove(key)
+                    self.evictions += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: Hashable, value: Any) -> bool:
+        size = self._sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return False
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, size, time.monotonic())
+            self._bytes += size
+            while self._data and (len(self._data) > self.max_entries or
+                                  (self.max_bytes is not None and self._bytes > self.max_bytes)):
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+        return True
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            self._remove(key)
+            return item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
@@ -0,0 +1,236 @@
+import json
+import re
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Column kinds and the declared SQLite type each one is created with. Dates are stored as
+# ISO text ('YYYY-MM-DD', 'YYYY-MM-DD HH:MM:SS' in UTC) so they sort, compare and work with
+# SQLite's date functions; booleans as 0/1.
+SQL_TYPES = {
+    "integer": "INTEGER",
+    "real": "REAL",
+    "boolean": "BOOLEAN",
+    "date": "DATE",
+    "datetime": "DATETIME",
+    "text": "TEXT COLLATE NOCASE",
+}
+_DECLARED = {"INTEGER": "integer", "REAL": "real", "BOOLEAN": "boolean", "DATE": "date", "DATETIME": "datetime"}
+
+_INT = re.compile(r"^-?(?:0|[1-9]\d*)$")
+# A decimal point or exponent is required: digit-only strings are integers or identifiers, never floats
+_REAL = re.compile(r"^-?(?:\d+\.\d*|\.\d+|\d+(?=[eE]))(?:[eE][+-]?\d+)?$")
+_LEADING_ZERO = re.compile(r"^-?0\d")
+_INT64 = (-(1 << 63), (1 << 63) - 1)
+_DATE = re.compile(r"^(\d{4})-(\d{2})-(\d{2})$")
+_DATETIME = re.compile(r"^(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2})(?::(\d{2})(?:\.\d+)?)?(Z|[+-]\d{2}:?\d{2})?$")
+_TRUE = {"true", "yes", "y", "1"}
+_FALSE = {"false", "no", "n", "0"}
+
+Type = Tuple[str, Optional[str]]       # (kind, strptime format for date/datetime overrides)
+
+
+def flatten(row: dict, prefix: str = "", out: Optional[dict] = None) -> dict:
+    # {"site": {"city": "Pune"}} -> {"site_city": "Pune"}; lists are left as values for child tables
+    out = {} if out is None else out
+    for key, value in row.items():
+        name = f"{prefix}_{key}" if prefix else str(key)
+        if isinstance(value, dict) and value:
+            flatten(value, name, out)
+        else:
+            out[name] = value
+    return out
+
+
+def _fits_int64(value: int) -> bool:
+    return _INT64[0] <= value <= _INT64[1]
+
+
+def _parse_datetime(text: str) -> Optional[datetime]:
+    m = _DATETIME.match(text)
+    if not m:
+        return None
+    y, mo, d, h, mi, s, tz = m.groups()
+    try:
+        value = datetime(int(y), int(mo), int(d), int(h), int(mi), int(s or 0))
+    except ValueError:
+        return None
+    if tz and tz != "Z":
+        sign = 1 if tz[0] == "+" else -1
+        digits = tz[1:].replace(":", "")
+        value -= sign * timedelta(hours=int(digits[:2]), minutes=int(digits[2:]))
+    return value
+
+
+def _parse_date(text: str) -> Optional[date]:
+    m = _DATE.match(text)
+    if not m:
+        return None
+    try:
+        return date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+    except ValueError:
+        return None
+
+
+def _kind_of(value) -> Optional[str]:
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, int):
+        return "integer" if _fits_int64(value) else "text"
+    if isinstance(value, float):
+        return "real"
+    if not isinstance(value, str):
+        return "text"
+    text = value.strip()
+    if not text:
+        return None                 # an empty string says nothing about the column
+    if text.lower() in ("true", "false"):
+        return "boolean"
+    if text.startswith("+") or _LEADING_ZERO.match(text):
+        return "text"               # codes like "007" or "+4420" keep their exact spelling
+    if _INT.match(text):
+        # Identifiers too long for SQLite's 64-bit integers stay text rather than lose digits
+        return "integer" if _fits_int64(int(text)) else "text"
+    if _REAL.match(text):
+        return "real"
+    if _parse_date(text):
+        return "date"
+    if _parse_datetime(text):
+        return "datetime"
+    return "text"
+
+
+def infer_kind(values: Iterable) -> str:
+    kinds = {_kind_of(v) for v in values if v is not None} - {None}
+    if not kinds:
+        return "text"
+    if len(kinds) == 1:
+        return kinds.pop()
+    if kinds <= {"integer", "real"}:
+        return "real"
+    if kinds <= {"date", "datetime"}:
+        return "datetime"
+    return "text"
+
+
+def parse_override(spec: str) -> Optional[Type]:
+    # "integer", "real", "boolean", "text", "date", "datetime", or "date:%d/%m/%Y" with a format
+    kind, _, fmt = str(spec).partition(":")
+    kind = kind.strip().lower()
+    if kind not in SQL_TYPES:
+        print(f"  Ignoring unknown column type '{spec}'")
+        return None
+    return kind, (fmt or None) if kind in ("date", "datetime") else None
+
+
+def infer_types(rows: List[dict], columns: List[str], overrides: Dict[str, str]) -> Dict[str, Type]:
+    types = {}
+    for col in columns:
+        override = parse_override(overrides[col]) if col in overrides else None
+        types[col] = override or (infer_kind(row.get(col) for row in rows), None)
+    return types
+
+
+def declared_types(declared: Dict[str, str], overrides: Dict[str, str]) -> Dict[str, Type]:
+    # Types of an existing table, for appending to it; formats come from the overrides
+    types = {}
+    for col, decl in declared.items():
+        kind = _DECLARED.get((decl or "").split(" ")[0].upper(), "text")
+        override = parse_override(overrides[col]) if col in overrides else None
+        types[col] = (kind, override[1] if override and override[0] == kind else None)
+    return types
+
+
+def _blank(value) -> bool:
+    return isinstance(value, str) and not value.strip()
+
+
+# Each converter returns the typed value, None for a blank, or the value unchanged when it
+# does not parse (SQLite keeps it as text in that row rather than failing the load)
+def _to_integer(value):
+    if value is None or _blank(value):
+        return None
+    if isinstance(value, int):
+        return int(value) if isinstance(value, bool) or _fits_int64(value) else str(value)
+    text = str(value).strip()
+    if not isinstance(value, float) and not _INT.match(text) and not _REAL.match(text):
+        return value                # "007", "+44" and the like are kept exactly as sent
+    try:
+        number = int(text)
+        return number if _fits_int64(number) else value
+    except ValueError:
+        try:
+            number = float(value)
+        except ValueError:
+            return value
+        return int(number) if number.is_integer() else number
+
+
+def _to_real(value):
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if _blank(value):
+        return None
+    text = str(value).strip()
+    if _INT.match(text):
+        # Digit-only strings are exact as floats only up to 2**53; beyond that they are identifiers
+        return float(text) if abs(int(text)) <= 1 << 53 else value
+    return float(text) if _REAL.match(text) else value
+
+
+def _to_boolean(value):
+    if value is None or isinstance(value, bool):
+        return None if value is None else int(value)
+    text = str(value).strip().lower()
+    if not text:
+        return None
+    if text in _TRUE:
+        return 1
+    if text in _FALSE:
+        return 0
+    return value
+
+
+def _date_converter(kind: str, fmt: Optional[str]) -> Callable:
+    def convert(value):
+        if value is None or _blank(value) or not isinstance(value, str):
+            return None if value is None or _blank(value) else value
+        text = value.strip()
+        try:
+            parsed = datetime.strptime(text, fmt) if fmt else (_parse_datetime(text) or _parse_date(text))
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            return value
+        if isinstance(parsed, datetime) and parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        if kind == "date":
+            return (parsed.date() if isinstance(parsed, datetime) else parsed).isoformat()
+        if not isinstance(parsed, datetime):
+            parsed = datetime(parsed.year, parsed.month, parsed.day)
+        return parsed.strftime("%Y-%m-%d %H:%M:%S")
+    return convert
+
+
+def _to_text(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    if isinstance(value, int) and not _fits_int64(value):
+        return str(value)           # sqlite3 cannot bind integers wider than 64 bits
+    return value
+
+
+def converter(kind: str, fmt: Optional[str] = None) -> Callable:
+    if kind == "integer":
+        return _to_integer
+    if kind == "real":
+        return _to_real
+    if kind == "boolean":
+        return _to_boolean
+    if kind in ("date", "datetime"):
+        return _date_converter(kind, fmt)
+    return _to_text
+
+
+def row_converter(columns: List[str], types: Dict[str, Type]) -> Callable[[dict], tuple]:
+    converters = [(col, converter(*types.get(col, ("text", None)))) for col in columns]
+    return lambda row: tuple(convert(row.get(col)) for col, convert in converters)
@@ -1,15 +1,20 @@
+import asyncio
 import json
 import traceback
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, Form, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.sessions import SessionMiddleware
 from pydantic import BaseModel
 from typing import List, Dict, Optional
 import uvicorn
 import os
-from api_agent import run_agent, db_manager, memory, reload_agent_config, CONFIG_FILE
+from api_agent import (arun_agent, astream_agent, db_manager, table_router, agent_registry, session_summaries,
+                       memory_writes, session_memories, preload_totals, answer_cache, reload_agent_config, CONFIG_FILE)
+from telemetry import metrics
 
 app_root_path = os.getenv("ROOT_PATH", "/admin/db-config")
 
@@ -26,6 +31,73 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 
 templates = Jinja2Templates(directory="templates")
 
+@app.on_event("startup")
+async def load_data_on_startup():
+    db_manager.refresh_in_background()
+    pruned = session_summaries.prune(float(os.getenv("SUMMARY_RETENTION_DAYS", "30")) * 86400)
+    if pruned:
+        print(f"Pruned {pruned} stale session summaries.")
+
+@app.on_event("shutdown")
+async def flush_memory_on_shutdown():
+    await run_in_threadpool(memory_writes.close)
+    print(f"Memory writes flushed: {memory_writes.stats()}")
+
+class ChatOverloaded(Exception):
+    pass
+
+# Caps concurrent agent runs per process; a bounded number wait their turn, the rest get a 429
+class ChatLimiter:
+    def __init__(self, limit: int, max_queue: int):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiting = 0
+        self._slots = asyncio.Semaphore(limit)
+
+    def is_full(self) -> bool:
+        return self._slots.locked() and self.waiting >= self.max_queue
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.is_full():
+            raise ChatOverloaded()
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._slots.release()
+
+chat_limiter = ChatLimiter(
+    limit=int(os.getenv("MAX_CONCURRENT_CHATS", "8")),
+    max_queue=int(os.getenv("MAX_QUEUED_CHATS", "32"))
+)
+
+chat_rejections = metrics.counter("chat_rejected_total", "Chat requests turned away with a 429")
+
+def _cache_samples(field):
+    caches = {"sql_results": db_manager.result_cache, "routing": table_router.cache,
+              "agent_executors": agent_registry.executors, "session_summaries": session_summaries.cache,
+              "answers": answer_cache.cache}
+    return [({"cache": name}, cache.stats()[field]) for name, cache in caches.items()]
+
+# Read from the components' own counters when /metrics is scraped
+metrics.collected("cache_hits_total", "Cache hits", "counter", lambda: _cache_samples("hits"))
+metrics.collected("cache_misses_total", "Cache misses", "counter", lambda: _cache_samples("misses"))
+metrics.collected("cache_entries", "Entries currently cached", "gauge", lambda: _cache_samples("entries"))
+metrics.collected("memory_writes_queued", "Memory writes waiting to be stored", "gauge",
+                  lambda: [({}, memory_writes.stats()["queued"])])
+metrics.collected("memory_writes_total", "Memory writes by result", "counter",
+                  lambda: [({"status": status}, memory_writes.stats()[status]) for status in ("written", "failed")])
+metrics.collected("chats_active", "Agent runs in progress", "gauge", lambda: [({}, chat_limiter.active)])
+metrics.collected("data_version", "Version of the data snapshot being served", "gauge", lambda: [({}, db_manager.version)])
+
 class ChatRequest(BaseModel):
     message: str
     session_id: str
@@ -62,34 +134,57 @@ async def chat_endpoint(req: ChatRequest):
     session_id = req.session_id
     try:
         print(f"Received query: {user_query} (Session: {session_id}, Language: {req.language})")
-        result = run_agent(user_query, session_id=session_id, history=req.history, language=req.language)
+        async with chat_limiter.slot():
+            result = await arun_agent(user_query, session_id=session_id, history=req.history, language=req.language)
         return result
+    except ChatOverloaded:
+        return overloaded_response()
     except Exception as e:
         print(f"Error processing query: {e}")
         return {"response": f"An error occurred: {str(e)}"}
 
+def overloaded_response():
+    chat_rejections.inc()
+    return JSONResponse(
+        status_code=429,
+        content={"response": "The assistant is busy right now. Please try again in a moment."},
+        headers={"Retry-After": "5"}
+    )
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(req: ChatRequest):
+    if chat_limiter.is_full():
+        return overloaded_response()
+
+    async def events():
+        try:
+            print(f"Received streaming query: {req.message} (Session: {req.session_id}, Language: {req.language})")
+            async with chat_limiter.slot():
+                async for event, data in astream_agent(req.message, session_id=req.session_id, history=req.history, language=req.language):
+                    yield sse_event(event, data)
+        except ChatOverloaded:
+            yield sse_event("error", {"response": "The assistant is busy right now. Please try again in a moment."})
+        except Exception as e:
+            print(f"Error processing streaming query: {e}")
+            yield sse_event("error", {"response": f"An error occurred: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/history")
 async def history_endpoint(req: ChatRequest):
     try:
         print(f"Fetching history for session: {req.session_id}")
         session_id = req.session_id
 
-        raw_data = memory.get_all(user_id=session_id)
-        
-        if isinstance(raw_data, dict):
-            history_list = raw_data.get("results", [])
-        elif isinstance(raw_data, list):
-            history_list = raw_data
-        else:
-            history_list = []
-            
-        clean_history = []
-        for item in history_list:
-            if isinstance(item, dict):
-                clean_history.append(item.get('memory', ''))
-            elif isinstance(item, str):
-                clean_history.append(item)
-        
+        clean_history = await run_in_threadpool(session_memories, session_id)
+
         print(f"Successfully retrieved {len(clean_history)} messages.")
         return {"history": clean_history}
 
@@ -99,13 +194,36 @@ async def history_endpoint(req: ChatRequest):
         return {"history": [], "error": str(e)}
 
 @app.post("/refresh")
-async def refresh_endpoint():
+async def refresh_endpoint(mode: str = "incremental"):
     try:
-        status_msg = db_manager.refresh_data()
-        return {"status": status_msg}
+        status_msg = await run_in_threadpool(db_manager.refresh_data, mode != "full")
+        return {"status": status_msg, "version": db_manager.version, "sources": db_manager.last_refresh_report}
     except Exception as e:
         return {"status": f"Error refreshing data: {str(e)}"}
 
+@app.get("/status")
+async def status_endpoint():
+    status = db_manager.status()
+    status["routing"] = table_router.stats()
+    status["session_summaries"] = session_summaries.stats()
+    status["memory_writes"] = memory_writes.stats()
+    status["agents"] = agent_registry.stats()
+    status["schema_preload"] = dict(preload_totals)
+    status["answer_cache"] = answer_cache.stats()
+    return status
+
+@app.get("/indexes")
+async def indexes_endpoint():
+    return db_manager.index_report()
+
+@app.get("/memory")
+async def memory_endpoint():
+    return await run_in_threadpool(db_manager.memory_report)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/config")
 async def get_config_page(request: Request, user: str = Depends(get_current_user)):
     try:
@@ -137,7 +255,8 @@ async def save_config(request: Request):
         with open(CONFIG_FILE, "w") as f:
             json.dump(new_config, f, indent=2)
             
-        reload_agent_config()
+        # Rebuilding the router reads every table's entity names; keep it off the event loop
+        await run_in_threadpool(reload_agent_config)
         
         return {"status": "success"}
     except Exception as e:
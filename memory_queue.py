@@ -0,0 +1,161 @@
+import copy
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from telemetry import tracer
+
+
+# Write-behind buffer for mem0 `memory.add(..., infer=False)`. The response path only
+# enqueues; a background thread drains batches, embeds their texts in one embed_batch
+# call and stores them. Texts stay visible through `pending()` until they are persisted,
+# so the next turn of the same session can read its own writes.
+class MemoryWriteQueue:
+    def __init__(self,
+                 memory,
+                 batch_size: int = 32,
+                 flush_interval: float = 0.5,
+                 max_pending: int = 10000,
+                 max_attempts: int = 3):
+        self.memory = memory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self._queue = deque()
+        self._pending: Dict[str, List[dict]] = {}
+        self._cond = threading.Condition()
+        self._inflight = 0
+        self._closed = False
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self._thread = threading.Thread(target=self._run, name="memory-writer", daemon=True)
+        self._thread.start()
+
+    def add(self, content: str, user_id: str, metadata: Optional[dict] = None):
+        item = {"content": content, "user_id": user_id, "metadata": metadata or {}, "attempts": 0}
+        with self._cond:
+            if self._closed or len(self._queue) >= self.max_pending:
+                direct = True
+            else:
+                direct = False
+                self._queue.append(item)
+                self._pending.setdefault(user_id, []).append(item)
+                self._cond.notify()
+        if direct:
+            # Shutting down or too far behind: write on the caller's thread instead of dropping it
+            self._write([item])
+
+    def pending(self, user_id: str) -> List[str]:
+        with self._cond:
+            return [item["content"] for item in self._pending.get(user_id, [])]
+
+    def _take_batch(self) -> List[dict]:
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if not self._queue:
+                return []
+            # Give a burst of turns a moment to accumulate into one batch
+            if len(self._queue) < self.batch_size and not self._closed:
+                self._cond.wait(self.flush_interval)
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            self._inflight += len(batch)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            try:
+                with tracer.span("memory.write_batch", items=len(batch)):
+                    self._write(batch)
+            finally:
+                with self._cond:
+                    self._inflight -= len(batch)
+                    self._cond.notify_all()
+
+    def _write(self, batch: List[dict]):
+        texts = [item["content"] for item in batch]
+        embeddings = None
+        embedder = getattr(self.memory, "embedding_model", None)
+        if embedder is not None and hasattr(embedder, "embed_batch") and hasattr(self.memory, "_create_memory"):
+            try:
+                with tracer.span("memory.embed", items=len(texts)):
+                    embeddings = embedder.embed_batch(texts, "add")
+            except Exception as e:
+                print(f"Memory batch embedding failed, writing one by one: {e}")
+
+        for i, item in enumerate(batch):
+            try:
+                if embeddings is not None:
+                    # Same payload memory.add(infer=False) builds for a plain string message
+                    metadata = copy.deepcopy(item["metadata"])
+                    metadata["user_id"] = item["user_id"]
+                    metadata["role"] = "user"
+                    self.memory._create_memory(item["content"], {item["content"]: embeddings[i]}, metadata)
+                else:
+                    self.memory.add(item["content"], user_id=item["user_id"], metadata=item["metadata"], infer=False)
+                self._done(item, ok=True)
+            except Exception as e:
+                item["attempts"] += 1
+                if item["attempts"] < self.max_attempts and not self._closed:
+                    print(f"Memory write failed (attempt {item['attempts']}), retrying: {e}")
+                    with self._cond:
+                        self._queue.append(item)
+                        self._cond.notify()
+                else:
+                    print(f"Memory write dropped after {item['attempts']} attempts: {e}")
+                    self._done(item, ok=False)
+        with self._cond:
+            self.batches += 1
+
+    def _done(self, item: dict, ok: bool):
+        with self._cond:
+            items = self._pending.get(item["user_id"], [])
+            if item in items:
+                items.remove(item)
+            if not items:
+                self._pending.pop(item["user_id"], None)
+            if ok:
+                self.written += 1
+            else:
+                self.failed += 1
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            while self._queue or self._inflight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining if remaining is not None else self.flush_interval)
+        return True
+
+    def close(self, timeout: Optional[float] = 30) -> bool:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        # Anything still queued (the worker stops once the queue is drained) is written here
+        leftover = []
+        with self._cond:
+            while self._queue:
+                leftover.append(self._queue.popleft())
+        if leftover:
+            self._write(leftover)
+        return not self._thread.is_alive()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "queued": len(self._queue),
+                "inflight": self._inflight,
+                "written": self.written,
+                "failed": self.failed,
+                "batches": self.batches,
+            }
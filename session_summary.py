@@ -0,0 +1,84 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from cache import LRUCache
+
+
+def _fingerprint(texts: List[str]) -> str:
+    return hashlib.blake2b(texts[-1].encode("utf-8"), digest_size=12).hexdigest() if texts else ""
+
+
+# Rolling per-session summary of the messages that have fallen out of the recent window.
+# `folded` is how many of the session's oldest messages the summary already covers and
+# `marker` fingerprints the last of them, so a history that was cleared or rewritten is
+# detected and summarised again from scratch. Hot sessions are kept in an LRU whose TTL
+# evicts idle ones; everything is persisted to a small sqlite file under DATA_DIR.
+class SessionSummaryStore:
+    def __init__(self, path: str, max_sessions: int = 1024, idle_ttl: float = 3600):
+        self.path = path
+        self.cache = LRUCache(max_entries=max_sessions, ttl=idle_ttl)
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Every uvicorn worker opens this file; WAL and a busy timeout let their writes take turns
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_summaries ("
+            "session_id TEXT PRIMARY KEY, summary TEXT, folded INTEGER, marker TEXT, updated_at REAL)"
+        )
+        self._conn.commit()
+
+    def get(self, session_id: str) -> Optional[Tuple[str, int, str]]:
+        entry = self.cache.get(session_id)
+        if entry is not None:
+            return entry
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, folded, marker FROM session_summaries WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        entry = (row[0], row[1], row[2])
+        self.cache.put(session_id, entry)
+        return entry
+
+    def put(self, session_id: str, summary: str, folded_texts: List[str]):
+        entry = (summary, len(folded_texts), _fingerprint(folded_texts))
+        self.cache.put(session_id, entry)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO session_summaries VALUES (?, ?, ?, ?, ?)",
+                (session_id, entry[0], entry[1], entry[2], time.time())
+            )
+            self._conn.commit()
+
+    # Stored summary (if still valid for this history) and the older messages it does not cover yet
+    def pending(self, session_id: str, older_texts: List[str]) -> Tuple[Optional[str], List[str]]:
+        entry = self.get(session_id)
+        if entry is None:
+            return None, older_texts
+        summary, folded, marker = entry
+        if folded > len(older_texts) or _fingerprint(older_texts[:folded]) != marker:
+            return None, older_texts
+        return summary, older_texts[folded:]
+
+    def forget(self, session_id: str):
+        self.cache.pop(session_id)
+        with self._lock:
+            self._conn.execute("DELETE FROM session_summaries WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+    def prune(self, max_age: float) -> int:
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM session_summaries WHERE updated_at < ?", (time.time() - max_age,))
+            self._conn.commit()
+            return cur.rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            stored = self._conn.execute("SELECT COUNT(*) FROM session_summaries").fetchone()[0]
+        return {"stored": stored, "cache": self.cache.stats()}
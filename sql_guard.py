@@ -0,0 +1,150 @@
+import json
+import re
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+_SCAN = re.compile(r"^SCAN (\S+)")
+_FROM_ITEM = re.compile(r'(?:\bfrom\b|\bjoin\b|,)\s*"?([A-Za-z_]\w*)"?(?:\s+(?:as\s+)?"?([A-Za-z_]\w*)"?)?', re.I)
+_PARENS = re.compile(r"\([^()]*\)")
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_TOP_LIMIT = re.compile(r"\blimit\s+(\d+)(?:\s*(?:offset|,)\s*\d+)?\s*;?\s*$", re.I)
+# Top-level clauses that need every row combination before the first row comes out
+_NEEDS_ALL_ROWS = re.compile(r"\b(order\s+by|group\s+by|having|distinct|union|except|intersect|"
+                             r"count|sum|avg|min|max|total|group_concat)\b", re.I)
+_KEYWORDS = {"where", "join", "inner", "left", "right", "full", "cross", "natural", "on", "using", "group", "order",
+             "limit", "having", "union", "except", "intersect", "as", "select", "from", "window"}
+
+# Statements a read-only agent query may prepare; everything else is denied
+_ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION,
+                    getattr(sqlite3, "SQLITE_RECURSIVE", 33)}
+
+
+def _allow_all(*args):
+    return sqlite3.SQLITE_OK
+
+
+def _bounded_by_limit(query: str) -> bool:
+    # True when the outermost SELECT ends in LIMIT and nothing at its level needs all rows first,
+    # so SQLite stops after that many rows however large the join is
+    top = _STRINGS.sub("''", query)
+    while True:
+        stripped = _PARENS.sub("[]", top)
+        if stripped == top:
+            break
+        top = stripped
+    return bool(_TOP_LIMIT.search(top)) and not _NEEDS_ALL_ROWS.search(top)
+
+
+class QueryRejected(Exception):
+    def __init__(self, code: str, message: str, hint: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.hint = hint
+
+    def to_tool_text(self) -> str:
+        # Keeps the "SQL Error" prefix the agent and the stream already recognise
+        return "SQL Error: " + json.dumps({"code": self.code, "message": self.message, "hint": self.hint})
+
+
+# Checks and limits for SQL written by the agent: EXPLAIN QUERY PLAN is inspected for
+# full-scan cross joins before anything runs, the statement is authorised read-only, and
+# SQLite's progress handler aborts it once the wall-clock or VM-step budget is spent.
+class QueryGuard:
+    def __init__(self,
+                 timeout: float = 5.0,
+                 max_steps: int = 500_000_000,
+                 max_cross_rows: int = 10_000_000,
+                 hidden_prefixes: tuple = ("_gdm_", "_stage_", "sqlite_stat")):
+        self.timeout = timeout
+        self.max_steps = max_steps
+        self.max_cross_rows = max_cross_rows
+        self.hidden_prefixes = hidden_prefixes
+        self.step_interval = 10000
+
+    def check_plan(self, query: str, details: List[tuple], row_counts: Dict[str, int]):
+        # details: (id, parent, detail) rows; the loops of one join are siblings under a parent.
+        # Only scans of base tables with a known row count are estimated; subqueries, CTEs and
+        # views are materialized from filtered or aggregated rows and their size is not known here.
+        if _bounded_by_limit(query):
+            return
+        aliases = {}
+        for table, alias in _FROM_ITEM.findall(query):
+            if table in row_counts:
+                aliases[table] = table
+                if alias and alias.lower() not in _KEYWORDS:
+                    aliases[alias] = table
+        scans = {}
+        for _, parent, detail in details:
+            m = _SCAN.match(detail)
+            table = aliases.get(m.group(1)) if m else None
+            if table is not None:
+                scans.setdefault(parent, []).append((m.group(1), row_counts[table]))
+        for loops in scans.values():
+            if len(loops) < 2:
+                continue
+            product = 1
+            for _, rows in loops:
+                product *= max(rows, 1)
+            if product > self.max_cross_rows:
+                names = ", ".join(name for name, _ in loops)
+                raise QueryRejected(
+                    "cross_join",
+                    f"The query joins {names} with full scans and no join condition an index can use "
+                    f"(about {product:,} row combinations).",
+                    "Add a JOIN ... ON condition that matches the relationship keys from the schema, "
+                    "or filter each table with WHERE before joining."
+                )
+
+    def _authorize(self, action, arg1, arg2, db_name, trigger):
+        if action not in _ALLOWED_ACTIONS:
+            return sqlite3.SQLITE_DENY
+        if action == sqlite3.SQLITE_READ and arg1 and arg1.startswith(self.hidden_prefixes):
+            return sqlite3.SQLITE_DENY
+        return sqlite3.SQLITE_OK
+
+    @contextmanager
+    def guarded(self, raw_conn: sqlite3.Connection, timeout: Optional[float] = None):
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        steps = [0]
+        tripped = [None]
+
+        def progress():
+            steps[0] += self.step_interval
+            if time.monotonic() > deadline:
+                tripped[0] = "timeout"
+                return 1
+            if steps[0] > self.max_steps:
+                tripped[0] = "too_many_steps"
+                return 1
+            return 0
+
+        raw_conn.set_authorizer(self._authorize)
+        raw_conn.set_progress_handler(progress, self.step_interval)
+        try:
+            yield tripped
+        finally:
+            raw_conn.set_progress_handler(None, self.step_interval)
+            # Pooled connections are reused unguarded; set_authorizer(None) only clears it from 3.11 on
+            raw_conn.set_authorizer(None if sys.version_info >= (3, 11) else _allow_all)
+
+    def classify(self, error: Exception, tripped: Optional[str]) -> QueryRejected:
+        message = str(getattr(error, "orig", None) or error)
+        if tripped == "timeout":
+            return QueryRejected("timeout", f"The query was stopped after {self.timeout:g}s.",
+                                 "Filter with WHERE on indexed columns, aggregate instead of listing rows, or add LIMIT.")
+        if tripped == "too_many_steps":
+            return QueryRejected("too_many_steps", "The query was stopped because it did too much work.",
+                                 "Filter with WHERE on indexed columns, aggregate instead of listing rows, or add LIMIT.")
+        if "not authorized" in message or "prohibited" in message:
+            return QueryRejected("read_only", "Only SELECT queries on the data tables are allowed.",
+                                 "Rewrite the request as a single SELECT statement.")
+        if "no such table" in message or "no such column" in message:
+            return QueryRejected("unknown_name", message,
+                                 "Check table and column names against the schema; quote names that contain spaces.")
+        if "syntax error" in message or "incomplete input" in message:
+            return QueryRejected("syntax", message, "Fix the SQL syntax (SQLite dialect) and try again.")
+        return QueryRejected("sql_error", message, "Check the query against the schema and try again.")
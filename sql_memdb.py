@@ -1,61 +1,1422 @@
-import pandas as pd
-from sqlalchemy import create_engine, text
-from sqlalchemy.types import Text
-from langchain_core.tools import Tool
-from typing import List
+import hashlib
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import time
+import requests
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import IntegrityError
+from langchain_core.tools import StructuredTool, Tool
+from pydantic import BaseModel, Field
+from collections import Counter, deque
+from typing import Callable, Dict, List, Optional, Tuple
 from api_class import APILookup 
-from sqlalchemy.pool import StaticPool
+from column_types import SQL_TYPES, declared_types, flatten, infer_types, row_converter
+from cache import LRUCache
+from sql_guard import QueryGuard, QueryRejected
+from telemetry import metrics, tracer
+from sqlalchemy.pool import QueuePool
+
+STATE_PREFIX = "_gdm_rowhash_"
+FTS_PREFIX = "_gdm_fts_"
+VOCAB_PREFIX = "_gdm_ftsvocab_"
+CHILD_SEP = "__"                # array field "lines" of table "orders" loads into "orders__lines"
+PARENT_PREFIX = "parent_"       # child column holding the parent's key column, e.g. parent_Order_No
+SNAPSHOT_FORMAT = 1
+MMAP_SIZE = 1 << 30
+INSERT_BATCH = 5000
+MAX_RESULT_ROWS = 50
+MAX_RESULT_COLUMNS = 25
+MAX_VALUE_CHARS = 300
+MAX_RESULT_CHARS = 12000        # roughly 3k tokens of rows per tool call
+FIND_CANDIDATES = 50            # rows taken from a search index before re-ranking
+FIND_MATCH_TRIGRAMS = 16        # rarest query trigrams that select the candidates
+FIND_COMMON_SHARE = 0.05        # trigrams in more than this share of rows do not select candidates
+
+_SQL_LITERAL = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+_PLAN_INDEX = re.compile(r"USING (?:COVERING )?INDEX (\S+)")
+_PLAN_SCAN = re.compile(r"^SCAN (?:TABLE )?(\S+)")
+_RANGE_TYPES = ("INTEGER", "BIGINT", "FLOAT", "REAL", "NUMERIC", "DATE", "DATETIME")
+
+_sql_queries = metrics.counter("sql_queries_total", "Agent SQL queries by outcome (ok, cached or an error code)", ("outcome",))
+_ingest_seconds = metrics.histogram("ingest_table_seconds", "Time to fetch and load one table during a refresh", ("table", "mode"))
+_ingest_rows = metrics.gauge("ingest_table_rows", "Rows received for a table in the last refresh", ("table",))
+_ingest_failures = metrics.counter("ingest_failures_total", "Tables that could not be loaded during a refresh", ("table",))
+
+
+def _row_key(row: dict, pk: List[str]) -> Optional[str]:
+    values = [row.get(c) for c in pk]
+    if any(v is None for v in values):
+        return None
+    return json.dumps(values, default=str)
+
+
+def _row_hash(row: dict) -> str:
+    return hashlib.blake2b(json.dumps(row, sort_keys=True, default=str).encode(), digest_size=16).hexdigest()
+
+
+def normalize_sql(query: str) -> str:
+    # Collapse whitespace and case outside quoted literals so near-identical queries share a cache key
+    parts = _SQL_LITERAL.split(query.strip().rstrip(";").strip())
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r"\s+", " ", parts[i]).lower()
+    return "".join(parts)
+
+
+def _clip(value, width: int):
+    if isinstance(value, str) and len(value) > width:
+        return value[:width] + f"... [{len(value) - width} more chars]"
+    return value
+
+
+def _shape_result(columns: List[str], rows: List[tuple], more: bool, total: Optional[int]) -> str:
+    # Column names once, then rows as arrays; long values clipped, extra columns dropped, and
+    # rows dropped from the end until the encoding fits the budget
+    notes = []
+    if len(columns) > MAX_RESULT_COLUMNS:
+        notes.append(f"Only the first {MAX_RESULT_COLUMNS} of {len(columns)} columns are shown; select the columns you need.")
+        columns = columns[:MAX_RESULT_COLUMNS]
+    rows = [[_clip(v, MAX_VALUE_CHARS) for v in row[:len(columns)]] for row in rows]
+
+    encoded = [json.dumps(row, ensure_ascii=False, default=str) for row in rows]
+    size, kept = 0, 0
+    for line in encoded:
+        if size + len(line) > MAX_RESULT_CHARS and kept:
+            break
+        size += len(line) + 1
+        kept += 1
+    if kept < len(rows):
+        more = True
+        notes.append(f"Only {kept} rows fit in the result budget.")
+
+    shown = {"columns": columns, "row_count": kept}
+    if more:
+        shown["total_rows"] = total
+        notes.insert(0, f"Results truncated: showing {kept} of {total if total is not None else 'more'} rows. "
+                        f"Please refine your query (e.g., add WHERE, LIMIT or aggregate).")
+    if notes:
+        shown["note"] = " ".join(notes)
+    header = json.dumps(shown, ensure_ascii=False)[:-1]
+    return header + ', "rows": [' + ", ".join(encoded[:kept]) + "]}"
+
+
+def _parent_key(pk: List[str]) -> List[str]:
+    # Child columns holding the parent's primary key; their own namespace, so element fields never clash
+    return [PARENT_PREFIX + c for c in pk]
+
+
+def _child_rows(row: dict, field: str, pk: List[str]) -> List[dict]:
+    # One row per array element, keyed by the parent's primary key and the element's position
+    items = row.get(field)
+    if not isinstance(items, list):
+        return []
+    link = {PARENT_PREFIX + c: row.get(c) for c in pk}
+    rows = []
+    for i, item in enumerate(items):
+        values = flatten(item) if isinstance(item, dict) else {"value": item}
+        row_link = {**link, "_idx": i}
+        rows.append({**row_link, **{(f"item_{k}" if k in row_link else k): v for k, v in values.items()}})
+    return rows
+
+
+def _overrides(api: APILookup, field: Optional[str] = None) -> Dict[str, str]:
+    # Child table columns are overridden as "field.column"; parent key columns keep the parent's types
+    types = api.config.column_types
+    if field is None:
+        return {k: v for k, v in types.items() if "." not in k}
+    prefix = field + "."
+    child = {k[len(prefix):]: v for k, v in types.items() if k.startswith(prefix)}
+    return {**{PARENT_PREFIX + c: types[c] for c in api.config.pk if c in types}, **child}
+
+
+def _short(value, width: int = 60) -> str:
+    value = str(value)
+    return value if len(value) <= width else value[:width - 3] + "..."
+
+
+def _column_line(col: dict) -> str:
+    line = f"{col['name']} {col['type'] or 'ANY'} - {col['null_ratio']:.0%} null, {col['distinct']} distinct"
+    if "min" in col:
+        line += f", range {_short(col['min'])} .. {_short(col['max'])}"
+    if col.get("top"):
+        line += "; values: " + ", ".join(f"{_short(v)!r} ({n})" for v, n in col["top"])
+    return line
+
+
+def _render_card(profile: dict) -> str:
+    info = f"ROW COUNT: {profile['rows']}\n"
+    info += "COLUMNS (name TYPE - nulls, distinct values):\n"
+    for col in profile["columns"]:
+        info += f"  - {_column_line(col)}\n"
+    if profile.get("children"):
+        info += "\nCHILD TABLES (one row per array element, _idx is its position):\n"
+        for child in profile["children"]:
+            info += f"  - {child['table']} ({child['rows']} rows) - JOIN {child['join']}\n"
+            for col in child["columns"]:
+                info += f"      - {_column_line(col)}\n"
+    if profile["examples"]:
+        info += "\nEXAMPLE ROWS:\n"
+        for i, row in enumerate(profile["examples"], 1):
+            info += f"Row {i}: {row}\n"
+    return info
+
+
+def _trigrams(value: str) -> set:
+    # Same units as SQLite's trigram tokenizer: lower-cased, spaces included
+    value = " ".join(str(value).lower().split())
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+def _match_score(query_grams: set, value) -> float:
+    # Half containment (how much of the query the value covers, so partial names rank well)
+    # and half Dice similarity (so the closest full name wins among those)
+    grams = _trigrams(value) if value is not None else set()
+    if not query_grams or not grams:
+        return 0.0
+    common = len(query_grams & grams)
+    return (common / len(query_grams) + 2 * common / (len(query_grams) + len(grams))) / 2
+
+
+class _FindEntityInput(BaseModel):
+    name: str = Field(description="The name or part of the name to look up; misspellings are fine")
+    table: Optional[str] = Field(default=None, description="Only search this table")
+    limit: int = Field(default=5, description="How many candidates to return")
+
+
+def _deep_sizeof(value, seen: Optional[set] = None) -> int:
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_deep_sizeof(k, seen) + _deep_sizeof(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(_deep_sizeof(v, seen) for v in value)
+    return size
+
+
+def _readonly_pragmas(dbapi_conn, record):
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA query_only = ON")
+    cur.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    cur.close()
+
+
+def acquire_process_lock(directory: str, name: str) -> Optional[int]:
+    # Exclusive flock on directory/name, or None when another process holds it. The fd is
+    # held until the process exits; the kernel releases it if that process dies.
+    import fcntl
+    os.makedirs(directory, exist_ok=True)
+    fd = os.open(os.path.join(directory, name), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+class _DeltaUnsupported(Exception):
+    pass
+
+
+class _TableLoad:
+    def __init__(self, api: APILookup):
+        self.api = api
+        self.mode = None            # "full" or "incremental", decided when the first page arrives
+        self.columns = None
+        self.types = None           # column -> (kind, format), see column_types
+        self.convert = None         # row dict -> tuple of typed values in column order
+        self.child_fields = []      # array-valued fields, loaded into child tables
+        self.children = {}          # field -> {"table", "columns", "convert"} once the child table exists
+        self.rows = 0
+        self.pages = 0
+        self.error = None
+        self.fetch_seconds = None
+        self.fetched_at = None
+        self.since = None
+        self.refetch = False        # the watermark fetch cannot be applied as a delta; fetch everything again
+        self.track = True           # keep per-row fingerprints so the next refresh can be a delta
+        self.reset_state = False
+        self.state = None
+        self.seen = set()
+        self.changed = []
+        self.changed_state = {}
+        self.inserted = 0
+        self.updated = 0
+        self.deleted = 0
+
+    def report(self) -> dict:
+        entry = {"table": self.api.safe_name, "mode": self.mode, "rows": self.rows, "pages": self.pages,
+                 "fetch_seconds": self.fetch_seconds, "fetched_at": self.fetched_at, "error": self.error}
+        if self.mode == "incremental":
+            entry.update({"inserted": self.inserted, "updated": self.updated, "deleted": self.deleted,
+                          "unchanged": self.rows - self.inserted - self.updated})
+        return entry
+
+
+# An immutable, versioned copy of the global database. Refreshes build the next
+# snapshot off to the side; queries keep whichever snapshot they started on.
+class _Snapshot:
+    def __init__(self, version: int, path: Optional[str] = None, pool_size: int = 8):
+        self.version = version
+        self.path = path
+        if path is None:
+            # A named shared-cache memory database: every pooled connection sees the same data,
+            # so each query gets a connection (and progress handler) of its own. The anchor
+            # connection keeps the database alive while the pool opens and closes connections.
+            uri = f"file:gdm_{os.getpid()}_{id(self)}_v{version}?mode=memory&cache=shared"
+            self._anchor = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self.engine = create_engine(
+                "sqlite://",
+                creator=lambda: sqlite3.connect(uri, uri=True, check_same_thread=False),
+                poolclass=QueuePool,
+                pool_size=pool_size,
+                max_overflow=pool_size
+            )
+        else:
+            # A published file is never written again, so every worker can map it read-only
+            self.engine = create_engine(
+                f"sqlite:///file:{path}?mode=ro&immutable=1&uri=true",
+                connect_args={"check_same_thread": False},
+                pool_size=pool_size,
+                max_overflow=pool_size
+            )
+            event.listen(self.engine, "connect", _readonly_pragmas)
+        self.created_at = None
+        self.tables = {}
+        self.indexes = {}
+        self.profiles = {}
+        self.cards = {}
+        self.search = {}            # table -> columns in its trigram search index
+
+    def copy_from(self, other: "_Snapshot"):
+        src = other.engine.raw_connection()
+        dst = self.engine.raw_connection()
+        try:
+            src.driver_connection.backup(dst.driver_connection)
+        finally:
+            dst.close()
+            src.close()
+
+    def save(self, path: str):
+        dst = sqlite3.connect(path)
+        src = self.engine.raw_connection()
+        try:
+            src.driver_connection.backup(dst)
+        finally:
+            src.close()
+            dst.close()
+
+    def load(self, path: str):
+        src = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        dst = self.engine.raw_connection()
+        try:
+            src.backup(dst.driver_connection)
+        finally:
+            dst.close()
+            src.close()
+
 
 class GlobalDataManager:
-    def __init__(self, apis: List[APILookup]):
+    def __init__(self, apis: List[APILookup], max_workers: int = 8, incremental: bool = True,
+                 cold_start_timeout: float = 120, result_cache_entries: int = 512,
+                 result_cache_bytes: int = 16 * 1024 * 1024, card_top_values: int = 10,
+                 card_max_distinct: int = 25, snapshot_dir: Optional[str] = None, shared: bool = False,
+                 apis_loader: Optional[Callable[[], List[APILookup]]] = None, poll_interval: float = 1.0,
+                 query_guard: Optional[QueryGuard] = None):
         self.apis = apis
-        self.engine = create_engine(
-            "sqlite:///:memory:",
-            connect_args={"check_same_thread": False},
-            poolclass=StaticPool
-        )
-        self.is_loaded = False
+        self.max_workers = max_workers
+        self.incremental = incremental
+        self.cold_start_timeout = cold_start_timeout
+        self._snapshot = None
+        self._loaded = threading.Event()
+        self._refresh_lock = threading.Lock()
+        self._reconfigure_lock = threading.Lock()
+        self._reconfigured = False
+        self._next_version = 1
+        self.last_refresh_report = []
+        self._plan_lock = threading.Lock()
+        self._index_hits = Counter()
+        self._full_scans = Counter()
+        self._explained = 0
+        self._recent_plans = deque(maxlen=50)
+        self.result_cache = LRUCache(max_entries=result_cache_entries, max_bytes=result_cache_bytes)
+        self._swap_listeners = []
+        self.card_top_values = card_top_values
+        self.card_max_distinct = card_max_distinct
+        self.snapshot_dir = snapshot_dir
+        self.warm_started = None
+        self.query_guard = query_guard or QueryGuard()
+        self._rejections = Counter()
+        # Multi-worker mode: one process (whoever holds loader.lock) fetches and publishes
+        # versioned database files; every process serves the newest one read-only
+        self.shared = shared and bool(snapshot_dir)
+        self.apis_loader = apis_loader
+        self.poll_interval = poll_interval
+        self._loader_fd = None
+        self._manifest_mtime = None
+        self._handled_request = 0.0
+        self._watcher = None
 
-    def refresh_data(self):
-        print("Loading all data into Mem DB:")
-        
-        for api in self.apis:
-            data = api._fetch_data() 
-            if not data: continue
-            
-            raw_rows = [item['details'] for item in data]
-            df = pd.DataFrame(raw_rows)
-            
-            str_cols = df.select_dtypes(include=['object']).columns
-            dtype_mapping = {col: Text(collation='NOCASE') for col in str_cols}
+    @property
+    def is_loaded(self) -> bool:
+        return self._snapshot is not None
 
-            df.to_sql(api.safe_name, self.engine, index=False, if_exists='replace', dtype=dtype_mapping)
-            print(f"  Loaded table: {api.safe_name} ({len(df)} rows)")
-            
-        self.is_loaded = True
-        return "Data load complete. Tables are ready for joining."
+    @property
+    def version(self) -> int:
+        snapshot = self._snapshot
+        return snapshot.version if snapshot else 0
+
+    @property
+    def engine(self):
+        snapshot = self._snapshot
+        return snapshot.engine if snapshot else None
+
+    def _http_session(self) -> requests.Session:
+        # One keep-alive pool shared by every fetch worker
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _table_columns(self, conn, name: str) -> List[str]:
+        return [row[1] for row in conn.execute(text(f'PRAGMA table_info("{name}")'))]
+
+    def _fingerprint(self, api: APILookup, row: dict) -> str:
+        field = api.config.modified_field
+        return str(row.get(field)) if field else _row_hash(row)
+
+    def _since_params(self, engine, api: APILookup, incremental: bool) -> Optional[dict]:
+        if not (incremental and api.config.modified_field and api.modified_since_param):
+            return None
+        with engine.connect() as conn:
+            if not self._table_columns(conn, STATE_PREFIX + api.safe_name):
+                return None
+            watermark = conn.execute(text(f'SELECT MAX(h) FROM "{STATE_PREFIX}{api.safe_name}"')).scalar()
+        return {api.modified_since_param: watermark} if watermark else None
+
+    def _stream_source(self, api: APILookup, session: requests.Session, pages: queue.Queue, params: Optional[dict]):
+        start = time.perf_counter()
+        try:
+            for rows in api.iter_pages(session, params):
+                pages.put((api, rows, None))
+        except Exception as e:
+            api.last_error = f"{type(e).__name__}: {e}"
+        finally:
+            pages.put((api, None, time.perf_counter() - start))
+
+    def _child_tables(self, conn, name: str) -> List[str]:
+        configured = {api.safe_name for api in self.apis}
+        return [row[0] for row in conn.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'table' AND substr(name, 1, :n) = :prefix"),
+            {"n": len(name) + len(CHILD_SEP), "prefix": name + CHILD_SEP}) if row[0] not in configured]
+
+    def _table_types(self, conn, name: str) -> Dict[str, str]:
+        return {row[1]: row[2] for row in conn.execute(text(f'PRAGMA table_info("{name}")'))}
+
+    def _start_table(self, engine, load: _TableLoad, rows: List[dict], incremental: bool):
+        api = load.api
+        load.mode = "full"
+        load.track = all(c in rows[0] for c in api.config.pk)
+        # Arrays become child tables only when their rows can point back at the parent
+        fields = dict.fromkeys(key for row in rows for key in row)
+        if load.track:
+            load.child_fields = [f for f in fields if any(isinstance(row.get(f), list) for row in rows)]
+        if not (incremental and load.track):
+            return
+
+        with engine.connect() as conn:
+            declared = self._table_types(conn, api.safe_name)
+            has_state = bool(self._table_columns(conn, STATE_PREFIX + api.safe_name))
+            scalars = [f for f in fields if f not in load.child_fields]
+            types = declared_types(declared, _overrides(api))
+            # New upstream columns, a scalar that became an array or a changed type override need a full rebuild
+            if not (declared and has_state and set(scalars).issubset(declared)):
+                return
+            if set(load.child_fields) & set(declared):
+                return
+            if any(types[c][0] != spec.split(":")[0].strip().lower()
+                   for c, spec in _overrides(api).items() if c in types):
+                return
+            children = {}
+            for table in self._child_tables(conn, api.safe_name):
+                field = table[len(api.safe_name) + len(CHILD_SEP):]
+                child_declared = self._table_types(conn, table)
+                if not set(_parent_key(api.config.pk)).issubset(child_declared):
+                    return
+                child_types = declared_types(child_declared, _overrides(api, field))
+                children[field] = {"table": table, "columns": list(child_types), "types": child_types,
+                                   "convert": row_converter(list(child_types), child_types)}
+            load.state = dict(conn.execute(text(f'SELECT k, h FROM "{STATE_PREFIX}{api.safe_name}"')).all())
+        load.mode = "incremental"
+        load.columns = list(declared)
+        load.types = types
+        load.convert = row_converter(load.columns, types)
+        load.children = children
+        load.child_fields = list(dict.fromkeys(load.child_fields + list(children)))
+
+    def _add_columns(self, conn, table: str, columns: List[str], types: Dict[str, tuple],
+                     rows: List[dict], overrides: Dict[str, str], skip: tuple = ()) -> List[str]:
+        # Keys that first appear after the first page are added to the table rather than dropped;
+        # their type comes from the page they arrived on
+        new = [c for c in dict.fromkeys(key for row in rows for key in row) if c not in types and c not in skip]
+        if new:
+            added = infer_types(rows, new, overrides)
+            for c in new:
+                conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN "{c}" {SQL_TYPES[added[c][0]]}'))
+            columns.extend(new)
+            types.update(added)
+        return new
+
+    def _extend_table(self, conn, table: str, load: _TableLoad, rows: List[dict]):
+        if load.track:
+            # An array field that was absent from the first page still becomes a child table
+            seen = set(load.types) | set(load.child_fields)
+            load.child_fields += [f for f in dict.fromkeys(key for row in rows for key in row)
+                                  if f not in seen and any(isinstance(row.get(f), list) for row in rows)]
+        if self._add_columns(conn, table, load.columns, load.types, rows, _overrides(load.api), tuple(load.child_fields)):
+            load.convert = row_converter(load.columns, load.types)
+
+    def _write_children(self, conn, load: _TableLoad, rows: List[dict], staged: bool):
+        api = load.api
+        for field in load.child_fields:
+            items = [item for row in rows for item in _child_rows(row, field, api.config.pk)]
+            if not items:
+                continue
+            child = load.children.get(field)
+            if child is None:
+                # Like the parent, the child's columns and types come from the first elements seen
+                name = f"{api.safe_name}{CHILD_SEP}{field}"
+                table = f"_stage_{name}" if staged else name
+                columns = list(dict.fromkeys(key for item in items for key in item))
+                types = infer_types(items, columns, _overrides(api, field))
+                types.update({PARENT_PREFIX + c: load.types[c] for c in api.config.pk if c in load.types})
+                col_sql = ", ".join(f'"{c}" {SQL_TYPES[types[c][0]]}' for c in columns)
+                conn.execute(text(f'DROP TABLE IF EXISTS "{table}"'))
+                conn.execute(text(f'CREATE TABLE "{table}" ({col_sql})'))
+                child = load.children[field] = {"table": table, "columns": columns, "types": types,
+                                                "convert": row_converter(columns, types)}
+            elif self._add_columns(conn, child["table"], child["columns"], child["types"], items, _overrides(api, field)):
+                child["convert"] = row_converter(child["columns"], child["types"])
+            cols = ", ".join(f'"{c}"' for c in child["columns"])
+            insert = f'INSERT INTO "{child["table"]}" ({cols}) VALUES ({", ".join("?" for _ in child["columns"])})'
+            for i in range(0, len(items), INSERT_BATCH):
+                conn.exec_driver_sql(insert, [child["convert"](item) for item in items[i:i + INSERT_BATCH]])
+
+    def _write_page(self, engine, load: _TableLoad, rows: List[dict]):
+        api = load.api
+        if load.mode == "incremental":
+            self._diff_page(load, rows)
+            load.rows += len(rows)
+            return
+
+        stage = f"_stage_{api.safe_name}"
+        with engine.begin() as conn:
+            if load.columns is None:
+                # Column set and types come from the first page; later pages can only add columns
+                load.columns = [c for c in dict.fromkeys(key for row in rows for key in row) if c not in load.child_fields]
+                load.types = infer_types(rows, load.columns, _overrides(api))
+                load.convert = row_converter(load.columns, load.types)
+                col_sql = ", ".join(f'"{c}" {SQL_TYPES[load.types[c][0]]}' for c in load.columns)
+                conn.execute(text(f'DROP TABLE IF EXISTS "{stage}"'))
+                conn.execute(text(f'CREATE TABLE "{stage}" ({col_sql})'))
+            else:
+                self._extend_table(conn, stage, load, rows)
+
+            cols = ", ".join(f'"{c}"' for c in load.columns)
+            insert = f'INSERT INTO "{stage}" ({cols}) VALUES ({", ".join("?" for _ in load.columns)})'
+            for i in range(0, len(rows), INSERT_BATCH):
+                conn.exec_driver_sql(insert, [load.convert(row) for row in rows[i:i + INSERT_BATCH]])
+            self._write_children(conn, load, rows, staged=True)
+        load.rows += len(rows)
+
+        if load.track:
+            self._stage_state(engine, load, rows)
+
+    def _stage_state(self, engine, load: _TableLoad, rows: List[dict]):
+        stage = f"_stage_{STATE_PREFIX}{load.api.safe_name}"
+        pk = load.api.config.pk
+        state = []
+        for row in rows:
+            key = _row_key(row, pk)
+            if key is None:
+                load.track = False
+                break
+            state.append({"k": key, "h": self._fingerprint(load.api, row)})
+
+        if load.pages == 0:
+            with engine.begin() as conn:
+                conn.execute(text(f'DROP TABLE IF EXISTS "{stage}"'))
+                conn.execute(text(f'CREATE TABLE "{stage}" (k TEXT PRIMARY KEY, h TEXT) WITHOUT ROWID'))
+        if load.track and state:
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(f'INSERT INTO "{stage}" (k, h) VALUES (:k, :h)'), state)
+            except IntegrityError:
+                # Duplicate primary keys: this table can only ever be fully reloaded
+                load.track = False
+        if not load.track:
+            with engine.begin() as conn:
+                conn.execute(text(f'DROP TABLE IF EXISTS "{stage}"'))
+
+    def _diff_page(self, load: _TableLoad, rows: List[dict]):
+        pk = load.api.config.pk
+        for row in rows:
+            key = _row_key(row, pk)
+            if key is None or key in load.seen:
+                raise _DeltaUnsupported(f"missing or duplicate primary key {key}")
+            load.seen.add(key)
+
+            fingerprint = self._fingerprint(load.api, row)
+            old = load.state.get(key)
+            if old == fingerprint:
+                continue
+            load.changed.append(row)
+            load.changed_state[key] = fingerprint
+            if old is None:
+                load.inserted += 1
+            else:
+                load.updated += 1
+
+    def _apply_delta(self, conn, load: _TableLoad):
+        api = load.api
+        name, state_table = api.safe_name, STATE_PREFIX + api.safe_name
+        pk = api.config.pk
+
+        # A "modified since" fetch only returns changed rows, so absent keys are not deletions
+        if api.modified_since_param and api.config.modified_field:
+            deleted = []
+        else:
+            deleted = [k for k in load.state if k not in load.seen]
+        stale = [k for k in load.changed_state if k in load.state] + deleted
+        load.deleted = len(deleted)
+
+        if stale:
+            where = " AND ".join(f'"{c}" = :p{i}' for i, c in enumerate(pk))
+            child_where = " AND ".join(f'"{c}" = :p{i}' for i, c in enumerate(_parent_key(pk)))
+            keys = [{f"p{i}": v for i, v in enumerate(json.loads(k))} for k in stale]
+            conn.execute(text(f'DELETE FROM "{name}" WHERE {where}'), keys)
+            for child in load.children.values():
+                conn.execute(text(f'DELETE FROM "{child["table"]}" WHERE {child_where}'), keys)
+        if load.changed:
+            self._extend_table(conn, name, load, load.changed)
+            cols = ", ".join(f'"{c}"' for c in load.columns)
+            conn.exec_driver_sql(f'INSERT INTO "{name}" ({cols}) VALUES ({", ".join("?" for _ in load.columns)})',
+                                 [load.convert(row) for row in load.changed])
+            self._write_children(conn, load, load.changed, staged=False)
+        if deleted:
+            conn.execute(text(f'DELETE FROM "{state_table}" WHERE k = :k'), [{"k": k} for k in deleted])
+        if load.changed_state:
+            conn.execute(text(f'INSERT OR REPLACE INTO "{state_table}" (k, h) VALUES (:k, :h)'),
+                         [{"k": k, "h": h} for k, h in load.changed_state.items()])
+
+    def _finish_table(self, engine, load: _TableLoad):
+        api = load.api
+        name, state_table = api.safe_name, STATE_PREFIX + api.safe_name
+        stage, stage_state = f"_stage_{name}", f"_stage_{state_table}"
+        if load.since and load.mode is None and not load.error:
+            load.mode = "incremental"       # nothing modified upstream since the last refresh
+            return True
+
+        if load.refetch or (load.mode == "full" and load.since):
+            # Never promote a stage built from a watermark fetch: it holds only the changed rows
+            load.error = load.error or "full reload needed but only changed rows were fetched"
+            load.mode = "full"
+
+        with engine.begin() as conn:
+            if load.mode == "incremental":
+                if load.error:
+                    if load.reset_state:
+                        conn.execute(text(f'DROP TABLE IF EXISTS "{state_table}"'))
+                    return False
+                self._apply_delta(conn, load)
+                return True
+
+            if load.error or not load.rows:
+                conn.execute(text(f'DROP TABLE IF EXISTS "{stage}"'))
+                conn.execute(text(f'DROP TABLE IF EXISTS "{stage_state}"'))
+                for child in load.children.values():
+                    conn.execute(text(f'DROP TABLE IF EXISTS "{child["table"]}"'))
+                return False
+            conn.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+            conn.execute(text(f'ALTER TABLE "{stage}" RENAME TO "{name}"'))
+            for table in self._child_tables(conn, name):
+                conn.execute(text(f'DROP TABLE IF EXISTS "{table}"'))
+            for child in load.children.values():
+                conn.execute(text(f'ALTER TABLE "{child["table"]}" RENAME TO "{child["table"][len("_stage_"):]}"'))
+            conn.execute(text(f'DROP TABLE IF EXISTS "{state_table}"'))
+            if load.track:
+                conn.execute(text(f'ALTER TABLE "{stage_state}" RENAME TO "{state_table}"'))
+        return True
+
+    def refresh_data(self, incremental: Optional[bool] = None):
+        if self.shared and not self._become_loader():
+            self._request_refresh(incremental)
+            return f"Refresh requested from the loader process. Serving data version {self.version}."
+        if not self._refresh_lock.acquire(blocking=False):
+            return f"A refresh is already running. Serving data version {self.version}."
+        released = False
+        try:
+            while True:
+                with self._reconfigure_lock:
+                    self._reconfigured = False
+                with tracer.span("refresh", incremental=self.incremental if incremental is None else incremental) as span:
+                    status = self._refresh(incremental)
+                    span.set(version=self.version)
+                # A reconfigure during the run was not part of it; load the new table list now.
+                # Releasing under the same lock means a reconfigure either sees this run or starts its own.
+                with self._reconfigure_lock:
+                    if not self._reconfigured:
+                        self._refresh_lock.release()
+                        released = True
+                        return status
+                print("API configuration changed during the refresh; refreshing again.")
+                incremental = None
+        finally:
+            if not released:
+                self._refresh_lock.release()
+
+    def refresh_in_background(self, incremental: Optional[bool] = None) -> bool:
+        if self._refresh_lock.locked() or (self.shared and not self._become_loader()):
+            return False
+        threading.Thread(target=self.refresh_data, args=(incremental,), daemon=True, name="gdm-refresh").start()
+        return True
+
+    def add_swap_listener(self, listener):
+        # Called with the new version, on the refresh thread, after every snapshot swap
+        self._swap_listeners.append(listener)
+
+    def reconfigure(self, apis: List[APILookup]):
+        # The current snapshot keeps serving until the new configuration has been loaded
+        self.apis = apis
+        if self.shared and not self._become_loader():
+            self._request_refresh(None, reconfigure=True)
+            return
+        with self._reconfigure_lock:
+            if self._refresh_lock.locked():
+                self._reconfigured = True       # picked up by the running refresh when it finishes
+                return
+        self.refresh_in_background()
+
+    def _refresh(self, incremental: Optional[bool]):
+        incremental = self.incremental if incremental is None else incremental
+        if self.shared and self.apis_loader is not None:
+            # The loader may have been asked to refresh by a worker that saved a new config
+            try:
+                self.apis = self.apis_loader()
+            except Exception as e:
+                print(f"  Could not reload API configs, keeping the current ones: {e}")
+        apis = list(self.apis)
+        current = self._snapshot
+        snapshot = _Snapshot(self._next_version, pool_size=self.max_workers)
+        self._next_version += 1
+        if current is not None:
+            snapshot.copy_from(current)
+        engine = snapshot.engine
+
+        print(f"Loading all data into Mem DB (version {snapshot.version}, {'incremental' if incremental else 'full'}):")
+        started = time.perf_counter()
+        loads = {api.safe_name: _TableLoad(api) for api in apis}
+
+        # Bounded so that only a few pages per source are ever held in memory at once
+        pages = queue.Queue(maxsize=self.max_workers * 2)
+        workers = max(1, min(self.max_workers, len(apis)))
+        with self._http_session() as session, ThreadPoolExecutor(max_workers=workers) as pool:
+            for api in apis:
+                loads[api.safe_name].since = self._since_params(engine, api, incremental)
+                pool.submit(self._stream_source, api, session, pages, loads[api.safe_name].since)
+
+            # SQLite writes stay on this thread; pages are inserted as they arrive
+            pending = len(apis)
+            while pending:
+                api, rows, elapsed = pages.get()
+                load = loads[api.safe_name]
+
+                if rows is not None:
+                    if load.error or load.refetch:
+                        continue
+                    try:
+                        # Nested objects become prefixed columns; rows are typed and split into child tables on write
+                        rows = [flatten(row) for row in rows]
+                        if load.mode is None:
+                            self._start_table(engine, load, rows, incremental)
+                            if load.mode == "full" and load.since:
+                                # A watermark fetch only has the changed rows; a rebuild needs all of them
+                                load.refetch = True
+                                continue
+                        self._write_page(engine, load, rows)
+                        load.pages += 1
+                    except Exception as e:
+                        load.error = f"{type(e).__name__}: {e}"
+                        load.reset_state = isinstance(e, _DeltaUnsupported)
+                    continue
+
+                if load.refetch and not (load.error or api.last_error):
+                    print(f"  Refetching {api.safe_name} without the watermark: the table needs a full reload")
+                    load = loads[api.safe_name] = _TableLoad(api)
+                    pool.submit(self._stream_source, api, session, pages, None)
+                    continue
+                pending -= 1
+                load.error = load.error or api.last_error
+                load.fetch_seconds = round(elapsed, 3)
+                load.fetched_at = time.time()
+                try:
+                    loaded = self._finish_table(engine, load)
+                except Exception as e:
+                    load.error = f"{type(e).__name__}: {e}"
+                    loaded = False
+                if not loaded:
+                    print(f"  Skipped table: {api.safe_name} ({load.error or 'no rows'}, {elapsed:.2f}s)")
+                elif load.mode == "incremental":
+                    print(f"  Updated table: {api.safe_name} (+{load.inserted} ~{load.updated} -{load.deleted} of {load.rows} rows, {elapsed:.2f}s)")
+                else:
+                    print(f"  Loaded table: {api.safe_name} ({load.rows} rows in {load.pages} pages, {elapsed:.2f}s)")
+                tracer.record("ingest.table", elapsed, error=load.error, table=api.safe_name, mode=load.mode,
+                              rows=load.rows, pages=load.pages)
+                _ingest_seconds.observe(elapsed, table=api.safe_name, mode=load.mode or "none")
+                _ingest_rows.set(load.rows, table=api.safe_name)
+                if load.error:
+                    _ingest_failures.inc(table=api.safe_name)
+
+        self._drop_unconfigured(engine, apis)
+        with tracer.span("refresh.indexes"):
+            snapshot.indexes = self._build_indexes(engine, apis)
+        with tracer.span("refresh.schema_cards"):
+            self._build_schema_cards(snapshot, current, loads)
+        with tracer.span("refresh.search"):
+            snapshot.search = self._build_search_indexes(engine, apis, loads)
+        report = [load.report() for load in loads.values()]
+        snapshot.tables = {e["table"]: e for e in report if not e["error"]}
+        if current is not None:
+            for name, entry in current.tables.items():
+                if name in loads:
+                    snapshot.tables.setdefault(name, entry)
+        snapshot.created_at = time.time()
+        self.last_refresh_report = report
+
+        if self.shared:
+            # Workers (this one included) switch over when they see the new manifest
+            with tracer.span("refresh.persist"):
+                published = self._persist(snapshot)
+            if published:
+                snapshot.engine.dispose()
+                snapshot = self._open_published(published)
+            self._swap(snapshot)
+        else:
+            self._swap(snapshot)
+            with tracer.span("refresh.persist"):
+                self._persist(snapshot)
+        failed = [e["table"] for e in report if e["error"]]
+        status = f"Data version {snapshot.version} loaded in {time.perf_counter() - started:.2f}s. Tables are ready for joining."
+        if failed:
+            status += f" Failed sources: {', '.join(failed)}."
+        return status
+
+    def _swap(self, snapshot: _Snapshot):
+        # Attribute assignment is atomic; in-flight queries finish on the snapshot they hold
+        self._snapshot = snapshot
+        self._loaded.set()
+        self.result_cache.clear()
+        for listener in self._swap_listeners:
+            try:
+                listener(snapshot.version)
+            except Exception as e:
+                print(f"  Swap listener error: {e}")
+
+    def _persist(self, snapshot: _Snapshot) -> Optional[dict]:
+        # Each version gets its own file; manifest.json is written last, via rename, and is
+        # the pointer readers follow, so they never see a half-written database
+        if not self.snapshot_dir:
+            return None
+        started = time.perf_counter()
+        name = f"snapshot-v{snapshot.version}.db"
+        db_path = os.path.join(self.snapshot_dir, name)
+        manifest_path = os.path.join(self.snapshot_dir, "manifest.json")
+        try:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            snapshot.save(db_path + ".tmp")
+            os.replace(db_path + ".tmp", db_path)
+            manifest = {
+                "format": SNAPSHOT_FORMAT,
+                "version": snapshot.version,
+                "file": name,
+                "created_at": snapshot.created_at,
+                "size": os.path.getsize(db_path),
+                "tables": snapshot.tables,
+                "indexes": snapshot.indexes,
+                "profiles": snapshot.profiles,
+                "search": snapshot.search,
+            }
+            with open(manifest_path + ".tmp", "w") as f:
+                json.dump(manifest, f, default=str)
+            os.replace(manifest_path + ".tmp", manifest_path)
+            print(f"  Saved snapshot v{snapshot.version} to {db_path} in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            print(f"  Snapshot save failed: {e}")
+            return None
+        self._prune_files(keep={name, f"snapshot-v{snapshot.version - 1}.db"})
+        return manifest
+
+    def _prune_files(self, keep: set):
+        # Workers still reading an older file keep it open; unlinking does not disturb them
+        for entry in os.listdir(self.snapshot_dir):
+            if entry.startswith("snapshot-v") and entry not in keep:
+                try:
+                    os.remove(os.path.join(self.snapshot_dir, entry))
+                except OSError:
+                    pass
+
+    def _read_manifest(self) -> Optional[dict]:
+        manifest_path = os.path.join(self.snapshot_dir, "manifest.json")
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        db_path = os.path.join(self.snapshot_dir, manifest.get("file", ""))
+        if manifest.get("format") != SNAPSHOT_FORMAT or manifest.get("size") != os.path.getsize(db_path):
+            print(f"Ignoring persisted snapshot in {self.snapshot_dir}: format or size mismatch")
+            return None
+        return manifest
+
+    def _restore(self, snapshot: _Snapshot, manifest: dict):
+        keep = {api.safe_name for api in self.apis}
+        snapshot.tables = {k: v for k, v in manifest["tables"].items() if k in keep}
+        snapshot.indexes = {k: v for k, v in manifest["indexes"].items() if k in keep}
+        snapshot.profiles = {k: v for k, v in manifest["profiles"].items() if k in keep}
+        snapshot.cards = {k: _render_card(v) for k, v in snapshot.profiles.items()}
+        snapshot.search = {k: v for k, v in manifest.get("search", {}).items() if k in keep}
+        snapshot.created_at = manifest["created_at"]
+        self._next_version = max(self._next_version, snapshot.version + 1)
+
+    def _open_published(self, manifest: dict) -> _Snapshot:
+        snapshot = _Snapshot(manifest["version"], path=os.path.join(self.snapshot_dir, manifest["file"]),
+                             pool_size=self.max_workers)
+        self._restore(snapshot, manifest)
+        return snapshot
+
+    def warm_start(self) -> bool:
+        # Serve the last persisted snapshot right away; a refresh revalidates it afterwards
+        if not self.snapshot_dir or self._snapshot is not None:
+            return False
+        if self.shared:
+            self._start_watcher()
+        started = time.perf_counter()
+        try:
+            manifest = self._read_manifest()
+            if manifest is None:
+                return False
+            if self.shared:
+                snapshot = self._open_published(manifest)
+            else:
+                snapshot = _Snapshot(manifest["version"], pool_size=self.max_workers)
+                snapshot.load(os.path.join(self.snapshot_dir, manifest["file"]))
+                self._drop_unconfigured(snapshot.engine, list(self.apis))
+                self._restore(snapshot, manifest)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            print(f"Failed to load persisted snapshot: {e}")
+            return False
+
+        self.warm_started = {"version": snapshot.version, "created_at": snapshot.created_at,
+                             "load_seconds": round(time.perf_counter() - started, 3), "shared": self.shared}
+        print(f"Warm start: data version {snapshot.version} from {self.snapshot_dir} "
+              f"({time.time() - snapshot.created_at:.0f}s old) in {self.warm_started['load_seconds']:.3f}s")
+        self._swap(snapshot)
+        return True
+
+    def _become_loader(self) -> bool:
+        if self._loader_fd is not None:
+            return True
+        fd = acquire_process_lock(self.snapshot_dir, "loader.lock")
+        if fd is None:
+            return False
+        self._loader_fd = fd
+        self._handled_request = time.time()
+        print(f"Process {os.getpid()} is the data loader for {self.snapshot_dir}")
+        return True
+
+    def _request_refresh(self, incremental: Optional[bool], reconfigure: bool = False):
+        path = os.path.join(self.snapshot_dir, "refresh.request")
+        with open(path + f".{os.getpid()}", "w") as f:
+            json.dump({"incremental": incremental, "reconfigure": reconfigure, "at": time.time()}, f)
+        os.replace(path + f".{os.getpid()}", path)
+
+    def _start_watcher(self):
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, daemon=True, name="gdm-watch")
+            self._watcher.start()
+
+    def _watch(self):
+        manifest_path = os.path.join(self.snapshot_dir, "manifest.json")
+        request_path = os.path.join(self.snapshot_dir, "refresh.request")
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                # Follow the published version
+                mtime = os.stat(manifest_path).st_mtime_ns if os.path.exists(manifest_path) else None
+                # A running refresh in this process swaps to what it publishes by itself
+                if mtime is not None and mtime != self._manifest_mtime and not self._refresh_lock.locked():
+                    self._manifest_mtime = mtime
+                    manifest = self._read_manifest()
+                    if manifest is not None and manifest["version"] > self.version:
+                        self._swap(self._open_published(manifest))
+                        print(f"Switched to published data version {manifest['version']}")
+
+                # Take over loading if the previous loader went away
+                if self._loader_fd is None:
+                    if self._become_loader() and mtime is None:
+                        self.refresh_in_background()
+                    continue
+
+                if os.path.exists(request_path) and os.stat(request_path).st_mtime > self._handled_request:
+                    with open(request_path) as f:
+                        request = json.load(f)
+                    # Left pending while a refresh is running, so it is picked up right after
+                    if self.refresh_in_background(request.get("incremental")):
+                        self._handled_request = time.time()
+            except Exception as e:
+                print(f"Snapshot watcher error: {e}")
+
+    def _drop_unconfigured(self, engine, apis: List[APILookup]):
+        keep = {api.safe_name for api in apis}
+        with engine.begin() as conn:
+            names = [row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))]
+            for name in names:
+                if name.startswith((FTS_PREFIX, VOCAB_PREFIX)):
+                    continue            # search indexes are dropped with their table in _build_search_indexes
+                base = name[len(STATE_PREFIX):] if name.startswith(STATE_PREFIX) else name
+                if base not in keep and not any(base.startswith(k + CHILD_SEP) for k in keep):
+                    conn.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+
+    def _index_specs(self, apis: List[APILookup]) -> Dict[str, List[tuple]]:
+        # (columns, nocase) per table, derived from pk, relationships, name_field and "indexes"
+        by_name = {}
+        for api in apis:
+            by_name[api.config.name] = api.safe_name
+            by_name[api.safe_name] = api.safe_name
+
+        specs = {api.safe_name: [] for api in apis}
+        for api in apis:
+            c = api.config
+            specs[api.safe_name].append((tuple(c.pk), False))
+            for rel in c.relationships:
+                specs[api.safe_name].append((tuple(rel['my_cols']), False))
+                target = by_name.get(rel['target_table'], rel['target_table'].lower().replace(" ", "_"))
+                if target in specs:
+                    specs[target].append((tuple(rel['target_cols']), False))
+            if c.name_field:
+                specs[api.safe_name].append(((c.name_field,), True))
+            for cols in c.indexes:
+                specs[api.safe_name].append((tuple(cols), False))
+        return specs
+
+    def _build_indexes(self, engine, apis: List[APILookup]) -> Dict[str, List[str]]:
+        built = {}
+        with engine.begin() as conn:
+            for table, specs in self._index_specs(apis).items():
+                columns = set(self._table_columns(conn, table))
+                if not columns:
+                    continue
+                for cols, nocase in dict.fromkeys(specs):
+                    if not cols or not set(cols).issubset(columns):
+                        continue
+                    name = f"ix_{table}__" + "__".join(cols) + ("__nocase" if nocase else "")
+                    collate = " COLLATE NOCASE" if nocase else ""
+                    col_sql = ", ".join(f'"{col}"{collate}' for col in cols)
+                    conn.execute(text(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({col_sql})'))
+                    built.setdefault(table, []).append(name)
+            # Child tables are joined to their parent on its primary key
+            for api in apis:
+                pk = _parent_key(api.config.pk)
+                for child in self._child_tables(conn, api.safe_name):
+                    if not set(pk).issubset(self._table_columns(conn, child)):
+                        continue
+                    name = f"ix_{child}__" + "__".join(pk)
+                    col_sql = ", ".join(f'"{col}"' for col in pk)
+                    conn.execute(text(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{child}" ({col_sql})'))
+                    built.setdefault(api.safe_name, []).append(name)
+            conn.execute(text("ANALYZE"))
+        return built
+
+    def _search_specs(self, apis: List[APILookup]) -> Dict[str, List[str]]:
+        specs = {}
+        for api in apis:
+            c = api.config
+            fields = list(dict.fromkeys(([c.name_field] if c.name_field else []) + c.search_fields))
+            if fields:
+                specs[api.safe_name] = fields
+        return specs
+
+    def _build_search_indexes(self, engine, apis: List[APILookup], loads: Dict[str, _TableLoad]) -> Dict[str, List[str]]:
+        # One trigram FTS5 index per table over name_field and "search_fields", reading the rows
+        # from the table itself (external content). It is rebuilt only when the table's rows
+        # changed in this refresh or its fields changed; otherwise the copy from the previous
+        # snapshot is still in step with the table.
+        specs = self._search_specs(apis)
+        built = {}
+        with engine.begin() as conn:
+            existing = [row[0] for row in conn.execute(text(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND sql LIKE 'CREATE VIRTUAL TABLE%'"))
+                if row[0].startswith(FTS_PREFIX)]
+            for name in existing:
+                if name[len(FTS_PREFIX):] not in specs:
+                    conn.execute(text(f'DROP TABLE IF EXISTS "{VOCAB_PREFIX}{name[len(FTS_PREFIX):]}"'))
+                    conn.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+
+            for table, fields in specs.items():
+                fts = FTS_PREFIX + table
+                columns = set(self._table_columns(conn, table))
+                fields = [f for f in fields if f in columns]
+                if not fields:
+                    conn.execute(text(f'DROP TABLE IF EXISTS "{VOCAB_PREFIX}{table}"'))
+                    conn.execute(text(f'DROP TABLE IF EXISTS "{fts}"'))
+                    continue
+                load = loads.get(table)
+                changed = load is not None and not load.error and (
+                    load.mode == "full" or load.inserted or load.updated or load.deleted)
+                if fts in existing and not changed and self._table_columns(conn, fts) == fields:
+                    built[table] = fields
+                    continue
+                try:
+                    conn.execute(text(f'DROP TABLE IF EXISTS "{fts}"'))
+                    cols = ", ".join(f'"{f}"' for f in fields)
+                    conn.execute(text(f'CREATE VIRTUAL TABLE "{fts}" USING fts5({cols}, content="{table}", '
+                                      f'content_rowid="rowid", tokenize="trigram")'))
+                    conn.execute(text(f'INSERT INTO "{fts}"("{fts}") VALUES (\'rebuild\')'))
+                    # Per-trigram document counts, so lookups can match on the rarest trigrams only
+                    conn.execute(text(f'CREATE VIRTUAL TABLE IF NOT EXISTS "{VOCAB_PREFIX}{table}" '
+                                      f'USING fts5vocab("{fts}", \'row\')'))
+                    built[table] = fields
+                except Exception as e:
+                    # e.g. SQLite older than 3.34 has no trigram tokenizer; find_entity falls back to LIKE
+                    print(f"  Search index for {table} not built: {e}")
+        return built
+
+    def _profile_table(self, conn, table: str) -> Optional[dict]:
+        info = list(conn.execute(text(f'PRAGMA table_info("{table}")')))
+        if not info:
+            return None
+        columns = [{"name": row[1], "type": row[2]} for row in info]
+
+        # One pass for the row count plus every column's null count, distinct count and numeric range
+        aggregates = ["COUNT(*)"]
+        for col in columns:
+            q = f'"{col["name"]}"'
+            aggregates += [f"SUM({q} IS NULL)", f"COUNT(DISTINCT {q})"]
+            if col["type"].upper() in _RANGE_TYPES:
+                aggregates += [f"MIN({q})", f"MAX({q})"]
+        values = list(conn.execute(text(f'SELECT {", ".join(aggregates)} FROM "{table}"')).one())
+
+        rows = values.pop(0)
+        for col in columns:
+            nulls, col["distinct"] = values.pop(0) or 0, values.pop(0)
+            col["null_ratio"] = nulls / rows if rows else 0.0
+            if col["type"].upper() in _RANGE_TYPES:
+                col["min"], col["max"] = values.pop(0), values.pop(0)
+            elif 0 < col["distinct"] <= self.card_max_distinct:
+                q = f'"{col["name"]}"'
+                col["top"] = [tuple(r) for r in conn.execute(text(
+                    f'SELECT {q}, COUNT(*) FROM "{table}" WHERE {q} IS NOT NULL GROUP BY {q} ORDER BY 2 DESC, 1 LIMIT :n'
+                ), {"n": self.card_top_values})]
+
+        result = conn.execute(text(f'SELECT * FROM "{table}" LIMIT 3'))
+        keys = list(result.keys())
+        examples = [{k: v for k, v in zip(keys, row) if v is not None} for row in result]
+        return {"table": table, "rows": rows, "columns": columns, "examples": examples}
+
+    def _build_schema_cards(self, snapshot: _Snapshot, current: Optional[_Snapshot], loads: Dict[str, _TableLoad]):
+        # Tables that did not change since the previous snapshot keep their card
+        with snapshot.engine.connect() as conn:
+            for name, load in loads.items():
+                unchanged = load.error or (load.mode == "incremental" and not (load.inserted or load.updated or load.deleted))
+                if unchanged and current is not None and name in current.profiles:
+                    snapshot.profiles[name] = current.profiles[name]
+                    snapshot.cards[name] = current.cards[name]
+                    continue
+                try:
+                    profile = self._profile_table(conn, name)
+                    if profile is not None:
+                        pk = load.api.config.pk
+                        profile["children"] = []
+                        for child in self._child_tables(conn, name):
+                            entry = self._profile_table(conn, child)
+                            entry.pop("examples")
+                            entry["join"] = " AND ".join(f'{child}."{PARENT_PREFIX}{c}" = {name}."{c}"' for c in pk)
+                            profile["children"].append(entry)
+                except Exception as e:
+                    print(f"  Schema card failed for {name}: {e}")
+                    continue
+                if profile is not None:
+                    snapshot.profiles[name] = profile
+                    snapshot.cards[name] = _render_card(profile)
+
+    def memory_report(self) -> dict:
+        # Bytes held per table: SQLite pages (data, rowhash state and indexes) plus whatever
+        # the API object still keeps after loading, which should only be its sample rows
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {"version": 0, "tables": {}}
+        tables = {api.safe_name: {"sqlite_bytes": 0, "state_bytes": 0, "index_bytes": 0, "search_bytes": 0,
+                                  "api_retained_bytes": _deep_sizeof(api._sample)} for api in self.apis}
+        # FTS5 keeps its index in shadow tables named after the virtual table
+        search_tables = sorted((FTS_PREFIX + table for table in snapshot.search), key=len, reverse=True)
+        owners = {}
+        with snapshot.engine.connect() as conn:
+            for name, tbl_name in conn.execute(text("SELECT name, tbl_name FROM sqlite_master WHERE type IN ('table', 'index')")):
+                owners[name] = tbl_name
+            try:
+                pages = list(conn.execute(text("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name")))
+            except Exception:
+                pages = []
+            page_size = conn.execute(text("PRAGMA page_size")).scalar()
+            page_count = conn.execute(text("PRAGMA page_count")).scalar()
+
+        for name, size in pages:
+            table = owners.get(name, name)
+            fts = next((f for f in search_tables if table == f or table.startswith(f + "_")), None)
+            if fts is not None:
+                entry, key = tables.get(fts[len(FTS_PREFIX):]), "search_bytes"
+            elif table.startswith(STATE_PREFIX):
+                entry, key = tables.get(table[len(STATE_PREFIX):]), "state_bytes"
+            else:
+                # Child tables count towards the table their rows came from
+                owner = next((t for t in tables if table.startswith(t + CHILD_SEP)), table) if table not in tables else table
+                entry, key = tables.get(owner), "index_bytes" if name != table else "sqlite_bytes"
+            if entry is not None:
+                entry[key] += size
+        return {"version": snapshot.version, "database_bytes": page_size * page_count, "tables": tables}
+
+    def schema_card(self, table: str) -> Optional[str]:
+        snapshot = self._snapshot
+        return snapshot.cards.get(table) if snapshot else None
+
+    def _record_plan(self, query: str, plan: List[tuple]):
+        details = [row[-1] for row in plan]
+        used = [m.group(1) for d in details for m in [_PLAN_INDEX.search(d)] if m and "AUTOMATIC" not in d]
+        scans = [m.group(1) for d in details for m in [_PLAN_SCAN.match(d)] if m and "USING" not in d]
+        with self._plan_lock:
+            self._explained += 1
+            self._index_hits.update(used)
+            self._full_scans.update(scans)
+            self._recent_plans.append({"sql": query, "plan": details, "indexes": used, "full_scans": scans})
+
+    def index_report(self) -> dict:
+        snapshot = self._snapshot
+        with self._plan_lock:
+            return {
+                "version": snapshot.version if snapshot else 0,
+                "indexes": snapshot.indexes if snapshot else {},
+                "queries_explained": self._explained,
+                "index_hits": dict(self._index_hits),
+                "full_scans": dict(self._full_scans),
+                "rejected": dict(self._rejections),
+                "recent": list(self._recent_plans),
+            }
+
+    def _current_snapshot(self) -> Optional[_Snapshot]:
+        snapshot = self._snapshot
+        if snapshot is None:
+            # Cold start only: there is no older version to answer from yet
+            self.refresh_in_background()
+            self._loaded.wait(self.cold_start_timeout)
+            snapshot = self._snapshot
+        return snapshot
+
+    def table_columns(self) -> Dict[str, List[str]]:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {}
+        with snapshot.engine.connect() as conn:
+            return {api.safe_name: self._table_columns(conn, api.safe_name) for api in self.apis}
+
+    def distinct_values(self, table: str, column: str, limit: int = 20000) -> List:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return []
+        with snapshot.engine.connect() as conn:
+            if column not in self._table_columns(conn, table):
+                return []
+            query = text(f'SELECT DISTINCT "{column}" FROM "{table}" WHERE "{column}" IS NOT NULL LIMIT :limit')
+            return [row[0] for row in conn.execute(query, {"limit": limit})]
+
+    def status(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version if snapshot else 0,
+            "loaded_at": snapshot.created_at if snapshot else None,
+            "refreshing": self._refresh_lock.locked(),
+            "tables": snapshot.tables if snapshot else {},
+            "last_refresh": self.last_refresh_report,
+            "warm_start": self.warm_started,
+            "shared": {"loader": self._loader_fd is not None, "pid": os.getpid(),
+                       "file": snapshot.path if snapshot else None} if self.shared else None,
+            "sql_cache": self.result_cache.stats(),
+        }
 
     def run_global_sql(self, query: str):
-        if not self.is_loaded:
-            self.refresh_data()
+        with tracer.span("sql.query") as span:
+            result, outcome = self._execute_sql(query)
+            span.set(outcome=outcome)
+            if outcome not in ("ok", "cached"):
+                span.status = "error"
+                span.error = result[:300]
+        _sql_queries.inc(outcome=outcome)
+        return result
+
+    def _execute_sql(self, query: str) -> Tuple[str, str]:
+        snapshot = self._current_snapshot()
+        if snapshot is None:
+            return "SQL Error: The database is still loading. Please try again shortly.", "loading"
+
+        # Keyed on the data version, so a refresh can never serve stale rows
+        cache_key = (snapshot.version, normalize_sql(query))
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            return cached, "cached"
             
+        guard = self.query_guard
+        row_counts = {name: profile["rows"] for name, profile in snapshot.profiles.items()}
+        row_counts.update({child["table"]: child["rows"] for profile in snapshot.profiles.values()
+                           for child in profile.get("children", [])})
         try:
-            with self.engine.connect() as conn:
-                result = conn.execute(text(query))
-                keys = result.keys()
-                rows = [dict(zip(keys, row)) for row in result.fetchall()]
-                
-                if len(rows) > 50:
-                    truncated = rows[:50]
-                    truncated.append({"System Note": f"Results truncated. {len(rows)} total rows found. Please refine your query (e.g., add WHERE or LIMIT)."})
-                    return truncated
-                return rows
+            with snapshot.engine.connect() as conn:
+                with guard.guarded(conn.connection.driver_connection) as tripped:
+                    try:
+                        plan = [(row[0], row[1], row[-1]) for row in conn.execute(text(f"EXPLAIN QUERY PLAN {query}"))]
+                        guard.check_plan(query, plan, row_counts)
+
+                        result = conn.execute(text(query))
+                        columns = list(result.keys())
+                        # Only one row past the limit is read; the rest of the result is never built
+                        rows = result.fetchmany(MAX_RESULT_ROWS + 1)
+                        result.close()
+                    except QueryRejected:
+                        raise
+                    except Exception as e:
+                        raise guard.classify(e, tripped[0])
+
+                    more = len(rows) > MAX_RESULT_ROWS
+                    rows = rows[:MAX_RESULT_ROWS]
+                    total = None
+                    if more:
+                        try:
+                            inner = query.strip().rstrip(";")
+                            total = conn.execute(text(f"SELECT COUNT(*) FROM ({inner})")).scalar()
+                        except Exception:
+                            pass
+                self._record_plan(query, plan)
+        except QueryRejected as e:
+            with self._plan_lock:
+                self._rejections[e.code] += 1
+            print(f"  SQL rejected ({e.code}): {e.message}")
+            return e.to_tool_text(), e.code
         except Exception as e:
-            return f"SQL Error: {str(e)}"
+            return f"SQL Error: {str(e)}", "sql_error"
+
+        formatted = _shape_result(columns, rows, more, total)
+        self.result_cache.put(cache_key, formatted)
+        return formatted, "ok"
+
+    def find_entity(self, name: str, table: Optional[str] = None, limit: int = 5) -> str:
+        with tracer.span("find_entity", table=table) as span:
+            result = self._find_entity(name, table, max(1, min(int(limit or 5), 20)))
+            span.set(candidates=len(result.get("candidates", [])))
+        return json.dumps(result, default=str)
+
+    def _find_entity(self, name: str, table: Optional[str], limit: int) -> dict:
+        snapshot = self._current_snapshot()
+        if snapshot is None:
+            return {"error": "The database is still loading. Please try again shortly."}
+        apis = {}
+        for api in self.apis:
+            apis[api.safe_name] = apis[api.config.name.lower()] = api
+        specs = self._search_specs(list(self.apis))
+        if table:
+            api = apis.get(table.strip().lower())
+            if api is None or api.safe_name not in specs:
+                return {"error": f"No searchable table named '{table}'.", "searchable_tables": sorted(specs)}
+            targets = [api]
+        else:
+            targets = [apis[t] for t in specs]
+
+        grams = _trigrams(name)
+        candidates = []
+        with snapshot.engine.connect() as conn:
+            for api in targets:
+                t = api.safe_name
+                fields = snapshot.search.get(t) or [f for f in specs[t] if f in self._table_columns(conn, t)]
+                if not fields:
+                    continue
+                pk = [col for col in api.config.pk if col not in fields]
+                select = ", ".join(f'"{t}"."{col}"' for col in pk + fields)
+                if t in snapshot.search and grams:
+                    # Rows sharing any of the query's rarest trigrams are candidates. Common ones
+                    # ("equ", "men") would make every row a candidate; misspelt ones occur nowhere.
+                    terms = sorted(grams)
+                    binds = ", ".join(f":g{i}" for i in range(len(terms)))
+                    counts = dict(conn.execute(text(f'SELECT term, doc FROM "{VOCAB_PREFIX}{t}" WHERE term IN ({binds})'),
+                                               {f"g{i}": g for i, g in enumerate(terms)}).all())
+                    ranked = sorted(counts, key=counts.get)
+                    if not ranked:
+                        continue
+                    rows_in_table = (snapshot.profiles.get(t) or {}).get("rows") or max(counts.values())
+                    terms = [g for g in ranked[:FIND_MATCH_TRIGRAMS] if counts[g] <= FIND_COMMON_SHARE * rows_in_table] or ranked[:1]
+                    fts = FTS_PREFIX + t
+                    match = " OR ".join('"' + g.replace('"', '""') + '"' for g in terms)
+                    rows = conn.execute(text(
+                        f'SELECT {select} FROM "{fts}" JOIN "{t}" ON "{t}".rowid = "{fts}".rowid '
+                        f'WHERE "{fts}" MATCH :match ORDER BY "{fts}".rank LIMIT :n'), {"match": match, "n": FIND_CANDIDATES})
+                else:
+                    # No index (or a query under three characters): substring scan of the fields
+                    where = " OR ".join(f'"{f}" LIKE :like' for f in fields)
+                    rows = conn.execute(text(f'SELECT {select} FROM "{t}" WHERE {where} LIMIT :n'),
+                                        {"like": f"%{name.strip()}%", "n": FIND_CANDIDATES})
+                for row in rows:
+                    values = dict(zip(pk + fields, row))
+                    if grams:
+                        scores = {f: _match_score(grams, values[f]) for f in fields}
+                    else:
+                        scores = {f: float(name.strip().lower() in str(values[f] or "").lower()) for f in fields}
+                    best = max(scores, key=scores.get)
+                    candidates.append({
+                        "table": t,
+                        "pk": {col: values[col] for col in api.config.pk},
+                        "match": {f: _clip(values[f], 120) for f in fields if values[f] is not None},
+                        "matched_field": best,
+                        "score": round(scores[best], 3),
+                    })
+
+        candidates.sort(key=lambda c: -c["score"])
+        result = {"query": name, "candidates": candidates[:limit]}
+        if candidates:
+            result["hint"] = "Filter execute_global_sql on the candidate's primary key instead of LIKE '%...%'."
+        else:
+            result["hint"] = "No similar names found. Try a shorter or different part of the name."
+        return result
+
+    def get_find_entity_tool(self) -> StructuredTool:
+        searchable = sorted(self._search_specs(list(self.apis)))
+        return StructuredTool.from_function(
+            func=self.find_entity,
+            name="find_entity",
+            description=(f"Finds rows by a partial or misspelled name using a fuzzy index and returns ranked "
+                         f"candidates with their primary key. Searchable tables: {', '.join(searchable) or 'none'}. "
+                         f"Use it before querying for a specific item by name."),
+            args_schema=_FindEntityInput
+        )
 
     def get_master_sql_tool(self) -> Tool:
         table_names = [api.safe_name for api in self.apis]
-        desc = f"Executes SQL queries on the Central Database. Available tables: {', '.join(table_names)}. You can perform JOINS between these tables."
+        desc = (f"Executes SQL queries on the Central Database. Available tables: {', '.join(table_names)}. You can perform JOINS between these tables. "
+                f"Results come back as {{\"columns\": [...], \"rows\": [[...], ...]}} with at most {MAX_RESULT_ROWS} rows.")
         
         return Tool(
             name="execute_global_sql",
@@ -0,0 +1,157 @@
+import math
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from api_class import APITableConfig
+from cache import LRUCache
+
+_WORD = re.compile(r"[a-z0-9]+")
+_GREETING = re.compile(r"^\s*(hi|hello|hey|hii+|thanks|thank you|ok|okay|good (morning|afternoon|evening))\W*$", re.I)
+# Questions about documents rather than rows; only the LLM router can send these to the RAG side ("None")
+_DOCUMENT = re.compile(
+    r"\b(manuals?|documents?|documentation|docs|datasheets?|data sheets?|spec|specs|specifications?|brochures?|"
+    r"guides?|guidelines?|instructions?|procedures?|sops?|troubleshoot\w*|how (do|to|can) (i|we|you)?\s*"
+    r"(install|use|operate|calibrate|clean|repair|fix|configure|set up|reset))\b", re.I)
+_STOPWORDS = {
+    "a", "an", "and", "any", "are", "as", "at", "be", "by", "can", "details", "do", "does", "for", "from", "give",
+    "has", "have", "how", "i", "in", "is", "it", "its", "list", "me", "many", "much", "of", "on", "or", "our",
+    "show", "table", "tell", "that", "the", "their", "there", "these", "this", "those", "to", "us", "what", "which",
+    "who", "with", "whether", "all", "like", "not", "only", "other", "consists", "entire", "relevant", "used",
+    "considered", "here", "items", "inherently", "filter", "column", "represents",
+}
+
+
+def _stem(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def _terms(text: str) -> List[str]:
+    words = _WORD.findall(re.sub(r"([a-z])([A-Z])", r"\1 \2", text or "").lower().replace("_", " "))
+    return [_stem(w) for w in words if w not in _STOPWORDS]
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(_WORD.findall(query.lower()))
+
+
+# Scores a query against table names, descriptions, column names and known entity
+# names. Confident decisions are answered locally; anything in the grey zone returns
+# None so the caller can fall back to the LLM router.
+class TableRouter:
+    def __init__(self,
+                 select_score: float = 3.0,
+                 ambiguous_score: float = 1.0,
+                 ambiguous_ratio: float = 0.25,
+                 cache_size: int = 2048,
+                 max_names_per_table: int = 20000):
+        self.select_score = select_score
+        self.ambiguous_score = ambiguous_score
+        self.ambiguous_ratio = ambiguous_ratio
+        self.max_names_per_table = max_names_per_table
+        self.cache = LRUCache(max_entries=cache_size)
+        self.version = 0
+        self.decisions = Counter()
+        self._lock = threading.Lock()
+        self._tables = []
+
+    def build(self,
+              configs: List[APITableConfig],
+              columns: Optional[Dict[str, List[str]]] = None,
+              names: Optional[Dict[str, Iterable[str]]] = None):
+        columns = columns or {}
+        names = names or {}
+        doc_terms = {c.name: set(_terms(c.description)) for c in configs}
+        df = Counter(t for terms in doc_terms.values() for t in terms)
+        n_docs = max(1, len(configs))
+
+        name_terms = {c.name: set(_terms(c.name)) for c in configs}
+        tables = []
+        for c in configs:
+            safe_name = c.name.lower().replace(" ", "_")
+            # A column like Equipment_ID on Spares refers to another table; it should not pull Spares in by itself
+            other_names = set().union(*[terms for name, terms in name_terms.items() if name != c.name])
+            entry = {
+                "name": c.name,
+                "name_terms": name_terms[c.name],
+                "description": {t: math.log(1 + n_docs / df[t]) for t in doc_terms[c.name]},
+                "columns": set(t for col in columns.get(safe_name, []) for t in _terms(col)) - other_names,
+                "names": set(),
+                "max_name_words": 0,
+            }
+            for value in names.get(safe_name, []):
+                if len(entry["names"]) >= self.max_names_per_table:
+                    break
+                key = normalize_query(str(value))
+                if key:
+                    entry["names"].add(key)
+                    entry["max_name_words"] = max(entry["max_name_words"], len(key.split()))
+            tables.append(entry)
+
+        with self._lock:
+            self._tables = tables
+            self.version += 1
+        self.cache.clear()
+
+    def _score(self, entry: dict, terms: List[str], words: List[str]) -> Tuple[float, bool]:
+        # (score, evidence): evidence is a column or a known entity name matched beyond the table's own name
+        score, evidence = 0.0, False
+        for t in set(terms):
+            if t in entry["name_terms"]:
+                score += 3.0
+            elif t in entry["columns"]:
+                score += 1.0
+                evidence = True
+            score += 0.5 * entry["description"].get(t, 0.0)
+
+        # Entity names: any run of up to max_name_words query words that is a known name
+        longest = min(entry["max_name_words"], 6)
+        for size in range(longest, 0, -1):
+            for i in range(len(words) - size + 1):
+                if " ".join(words[i:i + size]) in entry["names"]:
+                    return score + 2.0 + size, True
+        return score, evidence
+
+    def _evaluate(self, query: str) -> Dict[str, Tuple[float, bool]]:
+        terms = _terms(query)
+        words = normalize_query(query).split()
+        with self._lock:
+            tables = self._tables
+        return {entry["name"]: self._score(entry, terms, words) for entry in tables}
+
+    def scores(self, query: str) -> Dict[str, float]:
+        return {name: round(score, 3) for name, (score, _) in self._evaluate(query).items()}
+
+    def route(self, query: str) -> Optional[List[str]]:
+        if _GREETING.match(query):
+            return ["General"]
+
+        if _DOCUMENT.search(query):
+            return None
+
+        evaluated = self._evaluate(query)
+        scores = {name: score for name, (score, _) in evaluated.items()}
+        top = max(scores.values(), default=0.0)
+        floor = max(self.ambiguous_score, top * self.ambiguous_ratio)
+        selected = [name for name, score in scores.items() if score >= self.select_score]
+        ambiguous = [name for name, score in scores.items() if floor <= score < self.select_score]
+        # A table name alone is not enough: the rest of the question may be about another table's
+        # columns, or not about rows at all
+        if not selected or ambiguous or not all(evaluated[name][1] for name in selected):
+            return None
+        return sorted(selected, key=lambda name: -scores[name])
+
+    def cached(self, query: str) -> Optional[List[str]]:
+        return self.cache.get((self.version, normalize_query(query)))
+
+    def remember(self, query: str, tables: List[str], source: str):
+        self.decisions[source] += 1
+        self.cache.put((self.version, normalize_query(query)), list(tables))
+
+    def stats(self) -> dict:
+        return {"version": self.version, "decisions": dict(self.decisions), "cache": self.cache.stats()}
@@ -0,0 +1,352 @@
+import importlib
+import json
+import math
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _escape_help(value) -> str:
+    # HELP text escapes only backslash and newline; quotes are literal there, unlike in label values
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _format_labels(pairs: Iterable[Tuple[str, str]]) -> str:
+    pairs = list(pairs)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def samples(self) -> List[Tuple[str, tuple, float]]:
+        with self._lock:
+            return [(self.name, tuple(zip(self.labels, key)), value) for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def samples(self) -> List[Tuple[str, tuple, float]]:
+        out = []
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in items:
+            labels = tuple(zip(self.labels, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                out.append((self.name + "_bucket", labels + (("le", _format_value(bound)),), cumulative))
+            out.append((self.name + "_sum", labels, total))
+            out.append((self.name + "_count", labels, cumulative))
+        return out
+
+
+# Values read from an existing stats() call at scrape time, for counters the owning object
+# already keeps (cache hits, queue sizes) and that would otherwise have to be mirrored
+class _Collected(_Metric):
+    def __init__(self, name: str, help: str, kind: str, collect: Callable[[], Iterable[Tuple[dict, float]]]):
+        super().__init__(name, help)
+        self.kind = kind
+        self.collect = collect
+
+    def samples(self) -> List[Tuple[str, tuple, float]]:
+        try:
+            return [(self.name, tuple(sorted(labels.items())), value) for labels, value in self.collect()]
+        except Exception as e:
+            print(f"Metric collector {self.name} failed: {e}")
+            return []
+
+
+class MetricsRegistry:
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, *args, **kwargs):
+        name = self.prefix + name
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Gauge:
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name: str, help: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets)
+
+    def collected(self, name: str, help: str, kind: str, collect: Callable[[], Iterable[Tuple[dict, float]]]):
+        return self._get(_Collected, name, help, kind, collect)
+
+    def render(self) -> str:
+        # Prometheus text exposition format, version 0.0.4
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {_escape_help(metric.help)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class Span:
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_time = time.time()
+        self.duration = None
+        self.status = "ok"
+        self.error = None
+        self._started = time.perf_counter()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+                "start_time": self.start_time, "duration": self.duration, "status": self.status,
+                "error": self.error, "attributes": self.attributes}
+
+
+# Receives every span as it starts and ends. Subclass it to ship spans to a tracing
+# backend and register it with `tracer.add_hook` or the TRACE_HOOKS setting.
+class SpanHook:
+    def on_start(self, span: Span):
+        pass
+
+    def on_end(self, span: Span):
+        pass
+
+
+class JsonLinesHook(SpanHook):
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def on_end(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock, open(self.path, "a") as f:
+            f.write(line + "\n")
+
+
+def load_hook(spec: str) -> SpanHook:
+    # "package.module:factory"; the factory is called with no arguments
+    module_name, _, attr = spec.partition(":")
+    factory = getattr(importlib.import_module(module_name), attr)
+    return factory()
+
+
+# Spans nest through a context variable, so asyncio tasks and executor threads started
+# inside a span (which copy the context) report it as their parent. Every finished span
+# is timed into the span_seconds histogram by name and status.
+class Tracer:
+    def __init__(self, registry: MetricsRegistry):
+        self.hooks: List[SpanHook] = []
+        self._current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+        self.span_seconds = registry.histogram("span_seconds", "Duration of traced stages", ("span", "status"))
+
+    def add_hook(self, hook: SpanHook):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook: SpanHook):
+        if hook in self.hooks:
+            self.hooks.remove(hook)
+
+    def current(self) -> Optional[Span]:
+        return self._current.get()
+
+    def _call_hooks(self, method: str, span: Span):
+        for hook in list(self.hooks):
+            try:
+                getattr(hook, method)(span)
+            except Exception as e:
+                print(f"Span hook {type(hook).__name__}.{method} failed: {e}")
+
+    def start_span(self, name: str, parent: Optional[Span] = None, **attributes) -> Span:
+        # Not made current; for spans that start and end in different callbacks
+        parent = parent or self.current()
+        span = Span(name, parent.trace_id if parent else secrets.token_hex(16), parent.span_id if parent else None, attributes)
+        self._call_hooks("on_start", span)
+        return span
+
+    def end_span(self, span: Span, error: Optional[BaseException] = None, duration: Optional[float] = None):
+        if span.duration is not None:
+            return
+        span.duration = duration if duration is not None else time.perf_counter() - span._started
+        if error is not None:
+            span.status = "error"
+            span.error = f"{type(error).__name__}: {error}"
+        self.span_seconds.observe(span.duration, span=span.name, status=span.status)
+        self._call_hooks("on_end", span)
+
+    @contextmanager
+    def span(self, name: str, parent: Optional[Span] = None, **attributes):
+        span = self.start_span(name, parent, **attributes)
+        token = self._current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, error=e)
+            raise
+        finally:
+            self._current.reset(token)
+            self.end_span(span)
+
+    def record(self, name: str, duration: float, parent: Optional[Span] = None, error: Optional[str] = None, **attributes) -> Span:
+        # A span for work that was timed elsewhere (e.g. on a worker thread)
+        span = self.start_span(name, parent, **attributes)
+        span.start_time -= duration
+        if error:
+            span.status = "error"
+            span.error = error
+        self.end_span(span, duration=duration)
+        return span
+
+
+metrics = MetricsRegistry(prefix="api_agent_")
+tracer = Tracer(metrics)
+
+llm_calls = metrics.counter("llm_calls_total", "Chat model calls", ("purpose", "status"))
+llm_tokens = metrics.counter("llm_tokens_total", "Tokens reported by the chat model", ("purpose", "kind"))
+
+
+# LangChain callbacks turned into spans: one per chat model call and one per tool call,
+# under `parent` (the request's span). Token usage comes from the provider's response.
+class SpanCallbackHandler(BaseCallbackHandler):
+    run_inline = True
+
+    def __init__(self, tracer: Tracer, purpose: str, parent: Optional[Span] = None):
+        self.tracer = tracer
+        self.purpose = purpose
+        self.parent = parent or tracer.current()
+        self.turns = 0
+        self._spans: Dict[object, Span] = {}
+
+    def _start(self, run_id, name: str, **attributes):
+        self._spans[run_id] = self.tracer.start_span(name, self.parent, **attributes)
+
+    def _end(self, run_id, error: Optional[BaseException] = None, **attributes) -> Optional[Span]:
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            span.set(**attributes)
+            self.tracer.end_span(span, error=error)
+        return span
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self.turns += 1
+        self._start(run_id, f"llm.{self.purpose}", turn=self.turns)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self.turns += 1
+        self._start(run_id, f"llm.{self.purpose}", turn=self.turns)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = (getattr(response, "llm_output", None) or {}).get("token_usage") or {}
+        prompt, completion = usage.get("prompt_tokens"), usage.get("completion_tokens")
+        if prompt is None:
+            for generations in getattr(response, "generations", []) or []:
+                for generation in generations:
+                    meta = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    prompt = (prompt or 0) + meta.get("input_tokens", 0)
+                    completion = (completion or 0) + meta.get("output_tokens", 0)
+        llm_calls.inc(purpose=self.purpose, status="ok")
+        if prompt:
+            llm_tokens.inc(prompt, purpose=self.purpose, kind="prompt")
+        if completion:
+            llm_tokens.inc(completion, purpose=self.purpose, kind="completion")
+        self._end(run_id, prompt_tokens=prompt, completion_tokens=completion)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        llm_calls.inc(purpose=self.purpose, status="error")
+        self._end(run_id, error=error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        tool = (serialized or {}).get("name") or kwargs.get("name") or "tool"
+        if tool.startswith("describe_"):
+            self._start(run_id, "tool.describe", table=tool[len("describe_"):])
+        else:
+            self._start(run_id, f"tool.{tool}")
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        output = getattr(output, "content", output)
+        span = self._spans.get(run_id)
+        if span is not None and isinstance(output, str) and output.startswith("SQL Error"):
+            # The tool returned its error to the agent instead of raising
+            span.status = "error"
+            span.error = output[:300]
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=error)
@@ -0,0 +1,43 @@
+import pytest
+
+from api_class import APILookup, APITableConfig
+from column_types import converter, row_converter
+from sql_memdb import GlobalDataManager
+
+
+@pytest.mark.parametrize("kind", ["integer", "real", "boolean", "date", "datetime", "text"])
+def test_converters_pass_nulls_through(kind):
+    convert = converter(kind)
+    assert convert(None) is None
+    if kind != "text":
+        assert convert("") is None
+        assert convert("  ") is None
+
+
+def test_row_converter_missing_keys_are_null():
+    types = {"n": ("integer", None), "x": ("real", None), "b": ("boolean", None), "d": ("date", None)}
+    assert row_converter(list(types), types)({}) == (None, None, None, None)
+
+
+class _StaticAPI(APILookup):
+    def __init__(self, pages):
+        super().__init__(APITableConfig("T", "test table", "id"), "http://stub.invalid")
+        self.pages = pages
+
+    def iter_pages(self, session=None, params=None):
+        self.last_error = None
+        yield from self.pages
+
+
+def test_refresh_loads_typed_columns_with_nulls_and_missing_keys():
+    pages = [[{"id": 1, "n": "5", "x": "1.5", "b": "true", "d": "2024-01-02"},
+              {"id": 2, "n": None, "x": None, "b": None, "d": None},
+              {"id": 3}]]
+    manager = GlobalDataManager([_StaticAPI(pages)], snapshot_dir=None)
+    manager.refresh_data()
+
+    assert manager.last_refresh_report[0]["error"] is None
+    result = manager.run_global_sql("SELECT id, n, x, b, d FROM t ORDER BY id")
+    assert '[1, 5, 1.5, 1, "2024-01-02"]' in result
+    assert "[2, null, null, null, null]" in result
+    assert "[3, null, null, null, null]" in result
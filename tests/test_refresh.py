@@ -0,0 +1,47 @@
+import os
+import threading
+
+from api_class import APILookup, APITableConfig
+from sql_memdb import GlobalDataManager, acquire_process_lock
+
+
+class _BlockingAPI(APILookup):
+    def __init__(self, name, release=None, started=None):
+        super().__init__(APITableConfig(name, "test table", "id"), "http://stub.invalid")
+        self.release = release
+        self.started = started
+
+    def iter_pages(self, session=None, params=None):
+        self.last_error = None
+        if self.started is not None:
+            self.started.set()
+        if self.release is not None:
+            self.release.wait(5)
+        yield [{"id": 1}]
+
+
+def test_reconfigure_during_refresh_loads_the_new_tables():
+    started, release = threading.Event(), threading.Event()
+    manager = GlobalDataManager([_BlockingAPI("T", release, started)], snapshot_dir=None)
+    worker = threading.Thread(target=manager.refresh_data)
+    worker.start()
+    assert started.wait(5)
+
+    manager.reconfigure([_BlockingAPI("T"), _BlockingAPI("U")])
+    release.set()
+    worker.join(10)
+
+    assert not worker.is_alive()
+    assert set(manager.table_columns()) == {"t", "u"}
+    assert manager.run_global_sql("SELECT id FROM u").count("[1]") == 1
+
+
+def test_process_lock_is_exclusive_until_closed(tmp_path):
+    fd = acquire_process_lock(str(tmp_path), "worker.lock")
+    assert fd is not None
+    # flock is per open file, so a second open conflicts even within one process
+    assert acquire_process_lock(str(tmp_path), "worker.lock") is None
+    os.close(fd)
+    other = acquire_process_lock(str(tmp_path), "worker.lock")
+    assert other is not None
+    os.close(other)
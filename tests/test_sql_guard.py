@@ -0,0 +1,20 @@
+import sqlite3
+
+import pytest
+
+from sql_guard import QueryGuard
+
+
+def test_connection_is_usable_unguarded_after_a_guarded_query():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.execute("INSERT INTO t VALUES (1)")
+    guard = QueryGuard()
+
+    with guard.guarded(conn):
+        assert conn.execute("SELECT x FROM t").fetchall() == [(1,)]
+        with pytest.raises(sqlite3.DatabaseError):
+            conn.execute("DELETE FROM t")
+
+    conn.execute("INSERT INTO t VALUES (2)")
+    assert conn.execute("SELECT COUNT(*) FROM t").fetchone() == (2,)